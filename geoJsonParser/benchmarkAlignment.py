@@ -0,0 +1,107 @@
+import argparse
+import random
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+from shapely.geometry import Polygon
+
+from room import Room
+
+Ring = List[Tuple[float, float]]
+
+
+def exhaustive_alignment(inner_coords: Ring, outer_coords: Ring) -> Tuple[np.ndarray, np.ndarray]:
+    """The previous alignment (distance matrix + all rotations, O(n²)), as the reference for the results"""
+    inner_coords_np = np.array(inner_coords, dtype=np.float64)
+    outer_coords_np = np.array(outer_coords, dtype=np.float64)
+
+    if len(inner_coords_np) != len(outer_coords_np):
+        if len(inner_coords_np) < len(outer_coords_np):
+            shorter, longer = inner_coords_np, outer_coords_np
+        else:
+            shorter, longer = outer_coords_np, inner_coords_np
+        dists = np.linalg.norm(shorter[:, None] - longer[None, :], axis=-1)
+        matches = []
+        for row in dists:
+            row[matches] = np.inf
+            matches.append(int(np.argmin(row)))
+        if len(inner_coords_np) < len(outer_coords_np):
+            outer_coords_np = longer[matches]
+        else:
+            inner_coords_np = longer[matches]
+
+    best = (np.inf, False, 0)
+    for reversed_flag in [False, True]:
+        outer_to_test = outer_coords_np[::-1] if reversed_flag else outer_coords_np
+        for shift in range(len(outer_to_test)):
+            total_dist = np.linalg.norm(inner_coords_np - np.roll(outer_to_test, -shift, axis=0), axis=1).sum()
+            if total_dist < best[0]:
+                best = (total_dist, reversed_flag, shift)
+
+    _, best_reversed, best_rotation = best
+    aligned_outer = outer_coords_np[::-1] if best_reversed else outer_coords_np
+    return inner_coords_np, np.roll(aligned_outer, -best_rotation, axis=0)
+
+
+def wall_rings(polygon: Polygon, wall_thickness: float = 0.2) -> Tuple[Ring, Ring]:
+    """inner and outer ring of the walls of a room, like Room.get_wavefront_walls"""
+    inner = polygon.buffer(-wall_thickness / 2, join_style="mitre")
+    outer = polygon.buffer(wall_thickness / 2, join_style="mitre")
+    return list(inner.exterior.coords[:-1]), list(outer.exterior.coords[:-1])
+
+
+def noisy_ring(vertex_count: int, rng: random.Random) -> Polygon:
+    """a round room with vertex_count corners (radius 10m, 1cm noise)"""
+    angles = [2 * np.pi * i / vertex_count for i in range(vertex_count)]
+    return Polygon([((10 + 0.01 * rng.random()) * np.cos(a), (10 + 0.01 * rng.random()) * np.sin(a)) for a in angles])
+
+
+def make_cases(rng: random.Random) -> List[Tuple[str, Ring, Ring]]:
+    """rectangles and round rooms, with equal and unequal ring lengths (some outer vertices added / removed)"""
+    cases = []
+    inner, outer = wall_rings(Polygon([(0, 0), (5, 0), (5, 3), (0, 3)]))
+    cases.append(("rectangle", inner, outer[::-1]))
+
+    for vertex_count in (100, 1000):
+        inner, outer = wall_rings(noisy_ring(vertex_count, rng))
+        cases.append((f"ring {vertex_count}", inner, outer[vertex_count // 3:] + outer[:vertex_count // 3]))
+
+    inner, outer = wall_rings(noisy_ring(100, rng))
+    # 7 midpoints added to the outer ring
+    for i in sorted(rng.sample(range(len(outer)), 7), reverse=True):
+        following = outer[(i + 1) % len(outer)]
+        outer.insert(i + 1, ((outer[i][0] + following[0]) / 2, (outer[i][1] + following[1]) / 2))
+    cases.append((f"ring {len(inner)}/{len(outer)}", inner, outer))
+
+    inner, outer = wall_rings(noisy_ring(1000, rng))
+    # about every second outer vertex removed
+    outer = [point for i, point in enumerate(outer) if i % 2 == 0 or i % 89 == 0]
+    cases.append((f"ring {len(inner)}/{len(outer)}", inner, outer))
+    return cases
+
+
+def time_call(align: Callable[[Ring, Ring], Tuple[np.ndarray, np.ndarray]], inner: Ring, outer: Ring, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        align(inner, outer)
+    return (time.perf_counter() - start) / repeat
+
+
+# compares Room.align_polygon_coords with the exhaustive search it replaced (time per call, same result)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speed of the wall ring alignment")
+    parser.add_argument("--repeat", type=int, default=20, help="calls per case")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, inner, outer in make_cases(random.Random(args.seed)):
+        repeat = args.repeat if len(inner) * len(outer) < 100000 else max(1, args.repeat // 10)
+        exhaustive_time = time_call(exhaustive_alignment, inner, outer, repeat)
+        aligned_time = time_call(Room.align_polygon_coords, inner, outer, repeat)
+
+        expected = exhaustive_alignment(inner, outer)
+        result = Room.align_polygon_coords(inner, outer)
+        same = all(np.array_equal(a, b) for a, b in zip(expected, result))
+        print(f"{name:<14} exhaustive {1000 * exhaustive_time:8.2f} ms, align_polygon_coords {1000 * aligned_time:8.2f} ms, "
+              f"{'same result' if same else 'DIFFERENT result'}")
@@ -0,0 +1,82 @@
+import argparse
+import sys
+import time
+from typing import Any, Dict, List
+
+import main
+from room import Room
+
+
+def make_building(rooms_per_floor: int, floors: int) -> Dict[str, Any]:
+    """
+    Creates a synthetic building as GeoJSON: per floor one corridor with rooms_per_floor rooms along it
+    (each with a door to the corridor) and a stair at the end of the corridor.
+    """
+    def rectangle(lat0: float, lon0: float, lat1: float, lon1: float) -> List[List[float]]:
+        return [[lon0, lat0], [lon1, lat0], [lon1, lat1], [lon0, lat1]]
+
+    features = []
+    for level in range(floors):
+        corridor_end = 8.81 + 0.0001 * rooms_per_floor
+        features.append({"type": "Feature", "properties": {"level": str(level), "name": f"Corridor {level}"},
+                         "geometry": {"type": "Polygon", "coordinates": rectangle(50.81, 8.81, 50.81003, corridor_end)}})
+
+        for i in range(rooms_per_floor):
+            lon = 8.81 + 0.0001 * i
+            features.append({"type": "Feature", "properties": {"level": str(level), "name": f"{level:02d}{i:03d}"},
+                             "geometry": {"type": "Polygon", "coordinates": rectangle(50.81003, lon, 50.81008, lon + 0.0001)}})
+            features.append({"type": "Feature", "properties": {"level": str(level), "door": "yes"},
+                             "geometry": {"type": "Point", "coordinates": [lon + 0.00005, 50.81003]}})
+
+        features.append({"type": "Feature", "properties": {"level": str(level), "stairs": "yes", "name": f"Stairs ({level:02d}A1)"},
+                         "geometry": {"type": "Polygon", "coordinates": rectangle(50.81, corridor_end, 50.81003, corridor_end + 0.00005)}})
+        features.append({"type": "Feature", "properties": {"level": str(level), "door": "yes"},
+                         "geometry": {"type": "Point", "coordinates": [corridor_end, 50.810015]}})
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def object_size(obj: Any) -> int:
+    """Size of the object itself + its __dict__ (if it has one), not of the referenced values"""
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def report(name: str, total: int, count: int) -> None:
+    print(f"{name:<10} {count:>10} objects {total / max(count, 1):>8.1f} bytes each {total / 1024 ** 2:>8.2f} MiB")
+
+
+# builds a synthetic building and reports the memory used per graph vertex / edge / navigation grid cell
+# (object + __dict__ + own containers, shared values like rooms or floats are not counted)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory per vertex / edge / grid cell for a synthetic building")
+    parser.add_argument("--rooms", type=int, default=40, help="rooms per floor")
+    parser.add_argument("--floors", type=int, default=4)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph, rooms, stairs, doors = main.parse_geojson_to_graph(make_building(args.rooms, args.floors))
+    print(f"built {args.floors} floors with {args.rooms} rooms each in {time.perf_counter() - start:.1f}s")
+
+    vertices = list(graph.vertices.values())
+    # the vertex object itself (what __slots__ changes) and its containers (rooms, edges, neighbours), which are most of its memory
+    vertex_bytes = sum(object_size(v) for v in vertices)
+    adjacency_bytes = sum(sys.getsizeof(v.rooms) + sys.getsizeof(v.edges) + sys.getsizeof(v.neighbours)
+                          + sys.getsizeof(v._edges_by_neighbour) for v in vertices)
+
+    edges = [edge for v in vertices for edge in v.edges]
+    paths = {id(edge.path): edge.path for edge in edges}.values()
+    edge_bytes = sum(object_size(edge) for edge in edges)
+    path_bytes = sum(object_size(path) + sys.getsizeof(path.points) for path in paths)
+
+    cells = [cell for room in rooms + stairs for row in room.grid for cell in row if cell is not None]
+    cell_bytes = sum(object_size(cell) for cell in cells)
+
+    report("vertex", vertex_bytes, len(vertices))
+    report("adjacency", adjacency_bytes, len(vertices))
+    report("edge", edge_bytes, len(edges))
+    report("path", path_bytes, len(paths))
+    report("grid cell", cell_bytes, len(cells))
+    print("grid size:", Room.grid_size_x, Room.grid_size_y)
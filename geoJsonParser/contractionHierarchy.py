@@ -0,0 +1,331 @@
+import heapq
+import json
+import math
+import random
+import struct
+import sys
+import time
+from typing import List, Dict, Tuple, Optional, Sequence, BinaryIO, Set
+
+import numpy as np
+
+from routing import RoutingGraph, Route, Location
+
+# Binary layout of an exported contraction hierarchy (little endian):
+#   header      magic, version, vertex count, arc count
+#   rank        int32[V]        contraction order, searches only go from lower to higher ranks
+#   source      int32[C]
+#   target      int32[C]
+#   weight      float32[C]
+#   middle      int32[C]        -1 for edges of the graph, otherwise the contracted vertex the shortcut skips
+#                               (unpacking: source -> middle + middle -> target, both are arcs of this file as well)
+# Vertex ids are the ones of the exported graph json.
+
+MAGIC = b"IGCH"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHII")
+
+# settled vertices after which a witness search gives up (-> the shortcut is added, which is always correct).
+# Estimating the priorities uses a smaller limit, as it is done far more often than the contraction itself
+WITNESS_SETTLE_LIMIT = 500
+PRIORITY_SETTLE_LIMIT = 20
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over a RoutingGraph: every vertex has a rank, and the arcs (original ones + shortcuts)
+    are enough to find every shortest path with a search that only goes upwards (forward) / comes from above (backward).
+    """
+
+    def __init__(self, routing_graph: RoutingGraph, rank: List[int], arcs: Dict[Tuple[int, int], Tuple[float, int]]):
+        self.routing_graph = routing_graph
+        self.rank = rank
+        self.arcs = arcs    # (source, target) -> (weight, middle vertex or -1)
+
+        # forward search: arcs to higher ranks, backward search: arcs coming from higher ranks
+        self._up: List[List[Tuple[int, float]]] = [[] for _ in rank]
+        self._down: List[List[Tuple[int, float]]] = [[] for _ in rank]
+        for (source, target), (weight, _) in arcs.items():
+            if rank[target] > rank[source]:
+                self._up[source].append((target, weight))
+            else:
+                self._down[target].append((source, weight))
+
+        # cheapest graph arc per vertex pair, for turning the unpacked route back into arcs of the routing graph
+        self._graph_arcs: Dict[Tuple[int, int], int] = {}
+        for arc in np.argsort(-routing_graph.arc_weights, kind="stable").tolist():
+            self._graph_arcs[(int(routing_graph.arc_sources[arc]), int(routing_graph.arc_targets[arc]))] = arc
+
+
+    @property
+    def shortcut_count(self) -> int:
+        return sum(1 for _, middle in self.arcs.values() if middle != -1)
+
+
+    def shortest_path(self, start: Location, goal: Location) -> Optional[Route]:
+        """Shortest route between two vertices / positions (see RoutingGraph.shortest_path)"""
+        return self._search([self.routing_graph._resolve(start)], [self.routing_graph._resolve(goal)])
+
+
+    def route_to_room(self, start: Location, room_name: str) -> Optional[Route]:
+        """Shortest route to the closest door of a room (see RoutingGraph.route_to_room)"""
+        return self._search([self.routing_graph._resolve(start)], self.routing_graph.room_vertices[room_name])
+
+
+    def _search(self, sources: Sequence[int], targets: Sequence[int]) -> Optional[Route]:
+        """
+        Upward search from the sources and (backwards) from the targets,
+        the route goes over the vertex where both searches meet with the smallest total distance.
+        Unlike in the plain bidirectional search, each side has to run until its own queue minimum reaches the best distance.
+        """
+        distances = ({s: 0.0 for s in sources}, {t: 0.0 for t in targets})
+        parents: Tuple[Dict[int, int], Dict[int, int]] = ({}, {})
+        settled = (set(), set())
+        queues = ([(0.0, s) for s in distances[0]], [(0.0, t) for t in distances[1]])
+        adjacency = (self._up, self._down)
+
+        best = math.inf
+        meeting = None
+        for vertex in distances[0]:
+            if vertex in distances[1]:
+                best, meeting = 0.0, vertex
+
+        while (queues[0] and queues[0][0][0] < best) or (queues[1] and queues[1][0][0] < best):
+            side = 0 if queues[0] and (not queues[1] or queues[0][0][0] <= queues[1][0][0]) else 1
+            distance, vertex = heapq.heappop(queues[side])
+            if vertex in settled[side] or distance >= best:
+                continue
+            settled[side].add(vertex)
+
+            own_distances, other_distances = distances[side], distances[1 - side]
+            for neighbour, weight in adjacency[side][vertex]:
+                new_distance = distance + weight
+                if new_distance < own_distances.get(neighbour, math.inf):
+                    own_distances[neighbour] = new_distance
+                    parents[side][neighbour] = vertex
+                    heapq.heappush(queues[side], (new_distance, neighbour))
+                if neighbour in other_distances and own_distances[neighbour] + other_distances[neighbour] < best:
+                    best = own_distances[neighbour] + other_distances[neighbour]
+                    meeting = neighbour
+
+        if meeting is None:
+            return None
+
+        # CH vertices: sources -> meeting (forward parents), meeting -> targets (backward parents)
+        up = [meeting]
+        while up[-1] in parents[0]:
+            up.append(parents[0][up[-1]])
+        up.reverse()
+        down = [meeting]
+        while down[-1] in parents[1]:
+            down.append(parents[1][down[-1]])
+        ch_vertices = up + down[1:]
+
+        vertices = [ch_vertices[0]]
+        for source, target in zip(ch_vertices, ch_vertices[1:]):
+            vertices.extend(self.unpack(source, target)[1:])
+        arcs = [self._graph_arcs[(source, target)] for source, target in zip(vertices, vertices[1:])]
+        return self.routing_graph._make_route(sources, best, arcs, len(settled[0]) + len(settled[1]))
+
+
+    def unpack(self, source: int, target: int) -> List[int]:
+        """Graph vertices along the arc source -> target (replacing shortcuts recursively)"""
+        vertices = [source]
+        stack = [(source, target)]
+        while stack:
+            arc_source, arc_target = stack.pop()
+            middle = self.arcs[(arc_source, arc_target)][1]
+            if middle == -1:
+                vertices.append(arc_target)
+            else:
+                # second half is handled after the first one
+                stack.append((middle, arc_target))
+                stack.append((arc_source, middle))
+        return vertices
+
+
+def build_contraction_hierarchy(routing_graph: RoutingGraph) -> ContractionHierarchy:
+    """
+    Contracts the vertices one by one (the least important first, by edge difference + already contracted neighbours),
+    adding a shortcut u -> w (over v) whenever the path u -> v -> w might be the only shortest path between them.
+    The priorities are updated lazily (recomputed when a vertex comes up in the queue).
+    """
+    vertex_count = routing_graph.vertex_count
+    out_arcs: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(vertex_count)]
+    in_arcs: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(vertex_count)]
+
+    # parallel arcs are reduced to the cheapest one, loops are not needed
+    for source, target, weight in zip(routing_graph.arc_sources.tolist(), routing_graph.arc_targets.tolist(), routing_graph.arc_weights.tolist()):
+        if source != target and weight < out_arcs[source].get(target, (math.inf, -1))[0]:
+            out_arcs[source][target] = (weight, -1)
+            in_arcs[target][source] = (weight, -1)
+
+    # out_arcs / in_arcs only keep the arcs between not yet contracted vertices, arcs of contracted vertices move to arcs
+    arcs: Dict[Tuple[int, int], Tuple[float, int]] = {}
+    contracted = [False] * vertex_count
+    contracted_neighbours = [0] * vertex_count
+    rank = [0] * vertex_count
+
+    def witness_distances(source: int, skip: int, targets: Set[int], limit: float, settle_limit: int) -> Dict[int, float]:
+        """Dijkstra from source over the not contracted vertices (without skip), until all targets are settled / up to the distance limit"""
+        distances = {source: 0.0}
+        queue = [(0.0, source)]
+        remaining = set(targets)
+        settled = 0
+        while queue and remaining and settled < settle_limit:
+            distance, vertex = heapq.heappop(queue)
+            if distance > distances[vertex]:
+                continue
+            if distance > limit:
+                break
+            settled += 1
+            remaining.discard(vertex)
+            for neighbour, (weight, _) in out_arcs[vertex].items():
+                if neighbour == skip:
+                    continue
+                new_distance = distance + weight
+                if new_distance < distances.get(neighbour, math.inf):
+                    distances[neighbour] = new_distance
+                    heapq.heappush(queue, (new_distance, neighbour))
+        return distances
+
+    def needed_shortcuts(vertex: int, settle_limit: int) -> List[Tuple[int, int, float]]:
+        """shortcuts (source, target, weight) contracting the vertex would need"""
+        shortcuts = []
+        if not out_arcs[vertex]:
+            return shortcuts
+        for u, (in_weight, _) in in_arcs[vertex].items():
+            targets = {w: in_weight + out_weight for w, (out_weight, _) in out_arcs[vertex].items() if w != u}
+            if not targets:
+                continue
+            distances = witness_distances(u, vertex, set(targets), max(targets.values()), settle_limit)
+            for w, via_distance in targets.items():
+                if distances.get(w, math.inf) > via_distance:
+                    shortcuts.append((u, w, via_distance))
+        return shortcuts
+
+    def priority(vertex: int) -> int:
+        """edge difference (estimated) + contracted neighbours, lower = contracted earlier"""
+        shortcuts = needed_shortcuts(vertex, PRIORITY_SETTLE_LIMIT)
+        return len(shortcuts) - len(out_arcs[vertex]) - len(in_arcs[vertex]) + contracted_neighbours[vertex]
+
+    queue = [(priority(vertex), vertex) for vertex in range(vertex_count)]
+    heapq.heapify(queue)
+    next_rank = 0
+
+    while queue:
+        _, vertex = heapq.heappop(queue)
+        if contracted[vertex]:
+            continue
+
+        # lazy update: only contract if it is still the least important vertex
+        current_priority = priority(vertex)
+        if queue and current_priority > queue[0][0]:
+            heapq.heappush(queue, (current_priority, vertex))
+            continue
+
+        for u, w, weight in needed_shortcuts(vertex, WITNESS_SETTLE_LIMIT):
+            if weight < out_arcs[u].get(w, (math.inf, -1))[0]:
+                out_arcs[u][w] = (weight, vertex)
+                in_arcs[w][u] = (weight, vertex)
+
+        contracted[vertex] = True
+        rank[vertex] = next_rank
+        next_rank += 1
+
+        # the arcs of the vertex are final now (all its neighbours will get a higher rank)
+        for w, value in out_arcs[vertex].items():
+            arcs[(vertex, w)] = value
+            del in_arcs[w][vertex]
+            contracted_neighbours[w] += 1
+        for u, value in in_arcs[vertex].items():
+            arcs[(u, vertex)] = value
+            del out_arcs[u][vertex]
+            if u not in out_arcs[vertex]:
+                contracted_neighbours[u] += 1
+        out_arcs[vertex] = {}
+        in_arcs[vertex] = {}
+
+    return ContractionHierarchy(routing_graph, rank, arcs)
+
+
+def write_contraction_hierarchy(hierarchy: ContractionHierarchy, fileobj: BinaryIO) -> None:
+    """Writes the ranks and arcs of the hierarchy in the binary format described at the top of this file"""
+    keys = list(hierarchy.arcs.keys())
+    values = [hierarchy.arcs[key] for key in keys]
+    fileobj.write(_HEADER.pack(MAGIC, VERSION, len(hierarchy.rank), len(keys)))
+    for array in (np.array(hierarchy.rank, dtype=np.int32),
+                  np.array([source for source, _ in keys], dtype=np.int32),
+                  np.array([target for _, target in keys], dtype=np.int32),
+                  np.array([weight for weight, _ in values], dtype=np.float32),
+                  np.array([middle for _, middle in values], dtype=np.int32)):
+        fileobj.write(array.tobytes())
+
+
+def read_contraction_hierarchy(fileobj: BinaryIO, routing_graph: RoutingGraph) -> ContractionHierarchy:
+    """Reads a hierarchy written by write_contraction_hierarchy (for the graph it was built from)"""
+    data = fileobj.read()
+    magic, version, vertex_count, arc_count = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a contraction hierarchy file (version {VERSION})")
+    if vertex_count != routing_graph.vertex_count:
+        raise ValueError(f"Contraction hierarchy has {vertex_count} vertices, the graph {routing_graph.vertex_count}")
+
+    position = _HEADER.size
+    arrays = []
+    for dtype, count in ((np.int32, vertex_count), (np.int32, arc_count), (np.int32, arc_count), (np.float32, arc_count), (np.int32, arc_count)):
+        arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=position))
+        position += arrays[-1].nbytes
+    rank, sources, targets, weights, middles = (array.tolist() for array in arrays)
+    arcs = {(source, target): (weight, middle) for source, target, weight, middle in zip(sources, targets, weights, middles)}
+    return ContractionHierarchy(routing_graph, rank, arcs)
+
+
+# builds the hierarchy for an exported graph and compares it to Dijkstra: python contractionHierarchy.py resources/{building}_graph.json [queries]
+if __name__ == "__main__":
+    with open(sys.argv[1], encoding="utf-8") as f:
+        routing_graph = RoutingGraph.from_json(json.load(f))
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    start = time.perf_counter()
+    hierarchy = build_contraction_hierarchy(routing_graph)
+    print(f"{routing_graph.vertex_count} vertices, {routing_graph.arc_count} arcs -> {len(hierarchy.arcs)} hierarchy arcs "
+          f"({hierarchy.shortcut_count} shortcuts) in {time.perf_counter() - start:.2f}s")
+
+    random.seed(0)
+    rooms = sorted(routing_graph.room_vertices)
+    queries = [(random.randrange(routing_graph.vertex_count), random.choice(rooms)) for _ in range(query_count)]
+    queries += [(random.randrange(routing_graph.vertex_count), random.randrange(routing_graph.vertex_count)) for _ in range(query_count)]
+
+    def run(query_function) -> Tuple[List[Optional[Route]], float]:
+        query_start = time.perf_counter()
+        results = [query_function(source, target) for source, target in queries]
+        return results, (time.perf_counter() - query_start) / len(queries)
+
+    def dijkstra_query(source, target):
+        if isinstance(target, str):
+            return routing_graph.route_to_room(source, target, "dijkstra")
+        return routing_graph.shortest_path(source, target, "dijkstra")
+
+    def hierarchy_query(source, target):
+        if isinstance(target, str):
+            return hierarchy.route_to_room(source, target)
+        return hierarchy.shortest_path(source, target)
+
+    dijkstra_routes, dijkstra_time = run(dijkstra_query)
+    hierarchy_routes, hierarchy_time = run(hierarchy_query)
+
+    def settled(routes: List[Optional[Route]]) -> float:
+        return float(np.mean([route.settled for route in routes if route is not None]))
+
+    mismatches = sum((a is None) != (b is None) or (a is not None and not math.isclose(a.path.weight, b.path.weight, rel_tol=1e-9, abs_tol=1e-12))
+                     for a, b in zip(dijkstra_routes, hierarchy_routes))
+    # the unpacked route has to be a real path in the graph with the reported length
+    broken = sum(not math.isclose(sum(routing_graph.arc_weights[hierarchy._graph_arcs[pair]] for pair in zip(b.vertices, b.vertices[1:])),
+                                  b.path.weight, rel_tol=1e-9, abs_tol=1e-12)
+                 for b in hierarchy_routes if b is not None)
+    print(f"dijkstra  {1000 * dijkstra_time:7.3f} ms/query, {settled(dijkstra_routes):8.1f} vertices settled")
+    print(f"hierarchy {1000 * hierarchy_time:7.3f} ms/query, {settled(hierarchy_routes):8.1f} vertices settled "
+          f"(speedup {dijkstra_time / hierarchy_time:.1f}x)")
+    print(f"{len(queries)} queries, {mismatches} distance mismatches, {broken} broken unpacked routes")
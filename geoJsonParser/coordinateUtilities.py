@@ -1,5 +1,6 @@
-from typing import Tuple
+from typing import Tuple, List, Iterable
 import math
+import numpy as np
 
 origin_lat = 50.80977
 origin_lon = 8.81048
@@ -62,3 +63,23 @@ def normalize_lat_lon_to_meter(lat: float, lon: float) -> Tuple[float, float]:
     x_meter, y_meter = latlon_to_meters(lat-origin_lat, lon-origin_lon, origin_lat, origin_lon)
 
     return x_meter, -y_meter
+
+
+def quantize_points(points: Iterable[Tuple[float, float]], resolution: float) -> List[int]:
+    """
+    Quantizes points (in meters) to a grid of the given resolution and delta encodes them,
+    to save space in the exported graph.
+
+    :param points: (a, b) coordinate pairs
+    :param resolution: grid size in meters (e.g. 0.01 for 1cm)
+    :return: flat list [a0, b0, da1, db1, da2, db2, ...], the first point in grid units, the rest as differences to the previous point
+    """
+    grid = np.rint(np.asarray(list(points), dtype=np.float64).reshape(-1, 2) / resolution).astype(np.int64)
+    grid[1:] = np.diff(grid, axis=0)
+    return grid.ravel().tolist()
+
+
+def dequantize_points(encoded: List[int], resolution: float) -> List[Tuple[float, float]]:
+    """Inverse of quantize_points (up to the resolution)."""
+    grid = np.cumsum(np.asarray(encoded, dtype=np.int64).reshape(-1, 2), axis=0)
+    return [(a * resolution, b * resolution) for a, b in grid.tolist()]
@@ -1,10 +1,12 @@
 from __future__ import annotations
 import math
 from dataclasses import dataclass
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 
+from coordinateUtilities import quantize_points
 
-@dataclass
+
+@dataclass(slots=True)
 class PathVertex:
     # used for the visual path from door to door in each room
     x: float
@@ -56,7 +58,7 @@ class BoundingBox:
         return math.sqrt((self.max_x - self.min_x) ** 2 + (self.max_y - self.min_y) ** 2)
 
 
-@dataclass
+@dataclass(slots=True)
 class NavigationPath:
     weight: float
     points: List[Tuple[float, float]]
@@ -71,8 +73,17 @@ class NavigationPath:
         return NavigationPath(weight=self.weight, points=flipped_points)
 
 
-    def to_json(self) -> dict:
-        """Convert the NavigationPath object to a dictionary."""
+    def to_json(self, resolution: Optional[float] = None) -> dict:
+        """
+        Convert the NavigationPath object to a dictionary.
+        If a resolution (in meters) is given, the points are quantized and delta encoded (see quantize_points)
+        as a flat list [lat, lon, dlat, dlon, ...] instead of point objects.
+        """
+        if resolution is not None:
+            return {
+                "weight": self.weight,
+                "points": quantize_points(((lat, lon) for lon, lat in self.points), resolution)
+            }
         return {
             "weight": self.weight,
             "points": [{"lat": lat, "lon": lon} for lon, lat in self.points]  # points as objects
@@ -1,3 +1,4 @@
+import math
 from typing import Tuple, List, Any, Dict, TYPE_CHECKING
 
 from coordinateUtilities import normalize_lat_lon_to_meter
@@ -31,6 +32,15 @@ class Door:
         self.geometry: List[Tuple[float, float]] = []
 
 
+    def __getstate__(self) -> Dict[str, Any]:
+        """Only the geometry is pickled (used for sending doors to the mesh worker processes)."""
+        state = self.__dict__.copy()
+        state["graph"] = None
+        state["vertex"] = None
+        state["room1"] = None
+        state["room2"] = None
+        return state
+
     # just to be able to sort the doors
     def __lt__(self, other: "Door") -> bool:
         """Sorts by x-coordinate first, then y-coordinate."""
@@ -57,17 +67,24 @@ class Door:
             return
 
 
-        top_face = []
-        for i, point in enumerate(self.geometry):
-            x, y = point
-            x1, y1 = self.geometry[(i+1) % len(self.geometry)]
+        outline = [normalize_lat_lon_to_meter(x, y) for x, y in self.geometry]
+        center_x = sum(x for x, _ in outline) / len(outline)
+        center_y = sum(y for _, y in outline) / len(outline)
 
-            x, y = normalize_lat_lon_to_meter(x, y)
-            x1, y1 = normalize_lat_lon_to_meter(x1, y1)
+        top_face = []
+        for i, (x, y) in enumerate(outline):
+            x1, y1 = outline[(i+1) % len(outline)]
 
             top_face.append((x,1.8,y))
 
+            # horizontal normal of the side, pointing away from the door center
+            dx, dy = x1 - x, y1 - y
+            length = math.hypot(dx, dy)
+            normal = (-dy / length, 0, dx / length) if length else (0, 0, 0)
+            if normal[0] * ((x + x1) / 2 - center_x) + normal[2] * ((y + y1) / 2 - center_y) < 0:
+                normal = (-normal[0], 0, -normal[2])
+
             face = [(x,1.8,y), (x1,1.8,y1), (x1,0,y1), (x,0,y)]
-            wavefront.add_face(face, [(0,0,0), (1,0,0), (0,1,0), (1,1,0)], "DarkMaterial")
+            wavefront.add_face(face, [normal] * 4, "DarkMaterial")
 
-        wavefront.add_face(top_face[::-1], [(0,0,0), (1,0,0), (0,1,0), (1,1,0)], "DarkMaterial")
\ No newline at end of file
+        wavefront.add_face(top_face[::-1], [(0, 1, 0)] * len(top_face), "DarkMaterial")
\ No newline at end of file
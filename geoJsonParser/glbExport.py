@@ -0,0 +1,136 @@
+import json
+import struct
+from typing import Dict, List, Any, Tuple
+import numpy as np
+from wavefront import Wavefront
+
+# same colors as in the default .mtl file (unknown materials are white)
+MATERIAL_COLORS: Dict[str, Tuple[float, float, float]] = {
+    "WhiteMaterial": (1.0, 1.0, 1.0),
+    "DarkMaterial": (0.1, 0.1, 0.1),
+}
+
+# glTF constants
+_FLOAT = 5126
+_UNSIGNED_SHORT = 5123
+_UNSIGNED_INT = 5125
+_ARRAY_BUFFER = 34962
+_ELEMENT_ARRAY_BUFFER = 34963
+
+_GLB_MAGIC = 0x46546C67     # "glTF"
+_CHUNK_JSON = 0x4E4F534A    # "JSON"
+_CHUNK_BIN = 0x004E4942     # "BIN"
+
+
+class _BinaryBuffer:
+    """Collects the binary data of all meshes (the single GLB buffer) and the matching bufferViews / accessors."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.length: int = 0
+        self.buffer_views: List[Dict[str, Any]] = []
+        self.accessors: List[Dict[str, Any]] = []
+
+    def add_accessor(self, data: np.ndarray, component_type: int, accessor_type: str, target: int, with_bounds: bool = False) -> int:
+        """Appends the data (4 byte aligned) and returns the index of the new accessor."""
+        data_bytes = data.tobytes()
+        self.buffer_views.append({"buffer": 0, "byteOffset": self.length, "byteLength": len(data_bytes), "target": target})
+        self.chunks.append(data_bytes)
+        self.length += len(data_bytes)
+
+        padding = -self.length % 4
+        self.chunks.append(b"\x00" * padding)
+        self.length += padding
+
+        accessor = {
+            "bufferView": len(self.buffer_views) - 1,
+            "componentType": component_type,
+            "count": len(data),
+            "type": accessor_type,
+        }
+        if with_bounds:  # required for POSITION
+            accessor["min"] = data.min(axis=0).tolist()
+            accessor["max"] = data.max(axis=0).tolist()
+
+        self.accessors.append(accessor)
+        return len(self.accessors) - 1
+
+
+def write_glb(filename: str, meshes: Dict[str, Wavefront]) -> None:
+    """
+    Writes all given meshes into one binary glTF (.glb) file, sharing one binary buffer.
+    Each Wavefront becomes a node + mesh (named by its key), with one primitive per material.
+    Empty meshes are skipped (if all are empty, the file only has the asset info).
+    """
+    buffer = _BinaryBuffer()
+    materials: List[Dict[str, Any]] = []
+    material_indices: Dict[str, int] = {}
+    gltf_meshes: List[Dict[str, Any]] = []
+
+    for name, wavefront in meshes.items():
+        if wavefront.vertex_count == 0 or wavefront.face_count == 0:
+            continue
+
+        # glTF wants unit length normals, degenerated ones just point up
+        normals = wavefront.normals.astype(np.float32)
+        lengths = np.linalg.norm(normals, axis=1)
+        normals[lengths == 0] = (0.0, 1.0, 0.0)
+        lengths[lengths == 0] = 1.0
+        normals /= lengths[:, None]
+
+        position_accessor = buffer.add_accessor(np.ascontiguousarray(wavefront.vertices, dtype=np.float32), _FLOAT, "VEC3", _ARRAY_BUFFER, with_bounds=True)
+        normal_accessor = buffer.add_accessor(normals, _FLOAT, "VEC3", _ARRAY_BUFFER)
+
+        triangles, triangle_materials = wavefront.triangulate()
+        if wavefront.vertex_count <= np.iinfo(np.uint16).max:
+            index_type, index_component = np.uint16, _UNSIGNED_SHORT
+        else:
+            index_type, index_component = np.uint32, _UNSIGNED_INT
+
+        primitives = []
+        for material_id in np.unique(triangle_materials).tolist():
+            material_name = wavefront.material_names[material_id]
+            if material_name not in material_indices:
+                color = MATERIAL_COLORS.get(material_name, MATERIAL_COLORS["WhiteMaterial"])
+                material_indices[material_name] = len(materials)
+                materials.append({
+                    "name": material_name.strip() or "WhiteMaterial",
+                    "pbrMetallicRoughness": {"baseColorFactor": [*color, 1.0], "metallicFactor": 0.0, "roughnessFactor": 1.0},
+                })
+
+            primitive_indices = triangles[triangle_materials == material_id].ravel().astype(index_type)
+            primitives.append({
+                "attributes": {"POSITION": position_accessor, "NORMAL": normal_accessor},
+                "indices": buffer.add_accessor(primitive_indices, index_component, "SCALAR", _ELEMENT_ARRAY_BUFFER),
+                "material": material_indices[material_name],
+            })
+
+        gltf_meshes.append({"name": name, "primitives": primitives})
+
+    gltf: Dict[str, Any] = {"asset": {"version": "2.0", "generator": "IndoorNavigator geoJsonParser"}}
+    # glTF arrays can't be empty, so a floor without any faces is written as an asset without a scene
+    if gltf_meshes:
+        gltf.update({
+            "scene": 0,
+            "scenes": [{"nodes": list(range(len(gltf_meshes)))}],
+            "nodes": [{"name": mesh["name"], "mesh": i} for i, mesh in enumerate(gltf_meshes)],
+            "meshes": gltf_meshes,
+            "materials": materials,
+            "accessors": buffer.accessors,
+            "bufferViews": buffer.buffer_views,
+            "buffers": [{"byteLength": buffer.length}],
+        })
+
+    # chunks have to be 4 byte aligned, json is padded with spaces
+    json_bytes = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_bytes += b" " * (-len(json_bytes) % 4)
+    binary_bytes = b"".join(buffer.chunks)
+
+    total_length = 12 + 8 + len(json_bytes) + (8 + len(binary_bytes) if binary_bytes else 0)
+    with open(filename, "wb") as f:
+        f.write(struct.pack("<III", _GLB_MAGIC, 2, total_length))
+        f.write(struct.pack("<II", len(json_bytes), _CHUNK_JSON))
+        f.write(json_bytes)
+        if binary_bytes:
+            f.write(struct.pack("<II", len(binary_bytes), _CHUNK_BIN))
+            f.write(binary_bytes)
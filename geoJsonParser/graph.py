@@ -1,12 +1,16 @@
 from __future__ import annotations
+import io
 import json
-from typing import Set, Dict, Any, Optional, List, Tuple
+from collections import deque
+from typing import Set, Dict, Any, Optional, List, Tuple, TextIO, BinaryIO, Iterable
 
 from coordinateUtilities import normalize_lat_lon_to_meter
 from dataClasses import NavigationPath
 
 
 class Vertex:
+    __slots__ = ("name", "rooms", "x", "y", "floor", "edges", "neighbours", "_edges_by_neighbour")
+
     def __init__(self, name: str, x: float, y: float, floor: int):
         self.name: str = name
         self.rooms: List["Room"] = []  # List of room names associated with this vertex (for use in navigation)
@@ -15,6 +19,7 @@ class Vertex:
         self.floor: int = floor     # = level
         self.edges: Set[Edge] = set()
         self.neighbours: Set[Vertex] = set()
+        self._edges_by_neighbour: Dict[Vertex, Edge] = {}   # neighbour -> edge from this vertex to it (O(1) lookup / removal)
 
     def __eq__(self, other: object) -> bool:
         """for comparing vertices, so in sets and dicts if this is true, the vertices will overwrite each other"""
@@ -34,13 +39,39 @@ class Vertex:
         return (self.x, self.y, self.floor) < (other.x, other.y, other.floor)
 
 
-    def add_edge(self, vertex: Vertex, path: NavigationPath) -> Edge:
-        """Create an edge from this vertex to another vertex"""
-        edge = Edge(self, vertex, path)
-        self.edges.add(edge)
+    def add_edge(self, vertex: Vertex, path: NavigationPath, reversed: bool = False) -> Edge:
+        """
+        Create an edge from this vertex to another vertex (reversed: the path is walked backwards, see Edge)
+        If there already is an edge to that vertex, it is kept and returned.
+        """
+        edge = self._edges_by_neighbour.get(vertex)
+        if edge is None:
+            edge = self._edges_by_neighbour[vertex] = Edge(self, vertex, path, reversed)
+            self.edges.add(edge)
+        return edge
+
+
+    def get_edge(self, vertex: Vertex) -> Optional[Edge]:
+        """The edge from this vertex to another vertex (None if there is none)"""
+        return self._edges_by_neighbour.get(vertex)
+
+
+    def remove_edge(self, vertex: Vertex) -> Optional[Edge]:
+        """Remove the edge from this vertex to another vertex, returns it (None if there was none)"""
+        edge = self._edges_by_neighbour.pop(vertex, None)
+        if edge is not None:
+            self.edges.discard(edge)
         return edge
 
 
+    def rehash(self) -> None:
+        """Rebuilds the sets / dict of the edges and neighbours (needed after the coordinates, and so the hashes, of vertices changed)"""
+        # built from lists, as copying a set / dict keeps the old hashes
+        self.edges = set(list(self.edges))
+        self.neighbours = set(list(self.neighbours))
+        self._edges_by_neighbour = dict(list(self._edges_by_neighbour.items()))
+
+
     def distance_to(self, other: Vertex) -> float:
         """Calculate Euclidean distance between two vertices"""
         return ((self.x - other.x) ** 2 + (self.y - other.y) ** 2) ** 0.5
@@ -74,10 +105,31 @@ class Vertex:
 
 
 class Edge:
-    def __init__(self, vertex1: Vertex, vertex2: Vertex, path: NavigationPath):
+    """
+    Directed edge from vertex1 to vertex2.
+    Both directions of a bidirectional connection share one NavigationPath (stored in the direction of the forward edge),
+    the reverse edge only has the reversed flag set, its navigation_path is reversed on access.
+    """
+    __slots__ = ("vertex1", "vertex2", "path", "reversed")
+
+    def __init__(self, vertex1: Vertex, vertex2: Vertex, path: NavigationPath, reversed: bool = False):
         self.vertex1: Vertex = vertex1
         self.vertex2: Vertex = vertex2
-        self.navigation_path: NavigationPath = path
+        self.path: NavigationPath = path    # shared between both directions
+        self.reversed: bool = reversed
+
+    @property
+    def navigation_path(self) -> NavigationPath:
+        """The path from vertex1 to vertex2 (a reversed copy is only created here, for reverse edges)"""
+        return self.path.flip() if self.reversed else self.path
+
+    @property
+    def weight(self) -> float:
+        return self.path.weight
+
+    def get_points(self) -> Iterable[Tuple[float, float]]:
+        """The points from vertex1 to vertex2, without copying the path"""
+        return reversed(self.path.points) if self.reversed else iter(self.path.points)
 
     def __eq__(self, other: object) -> bool:
         """Compare edges based on their vertices"""
@@ -91,22 +143,25 @@ class Edge:
 
     def __repr__(self) -> str:
         """String representation of the Edge object"""
-        return f"Edge({self.vertex1.name}, {self.vertex2.name}, weight={self.navigation_path.weight})"
+        return f"Edge({self.vertex1.name}, {self.vertex2.name}, weight={self.weight})"
 
 
-    def to_json(self, vert1_id=None, ver2_id=None) -> dict:
-        """Convert edge to JSON serializable dictionary, if vertex_id is given, will use that instead of the vertex object"""
+    def to_json(self, vert1_id=None, ver2_id=None, resolution: Optional[float] = None) -> dict:
+        """
+        Convert edge to JSON serializable dictionary, if vertex_id is given, will use that instead of the vertex object
+        (resolution: see NavigationPath.to_json)
+        """
         if vert1_id is not None and ver2_id is not None:
             return {
                 "v1": vert1_id,
                 "v2": ver2_id,
-                "path": self.navigation_path.to_json()
+                "path": self.navigation_path.to_json(resolution)
             }
         else:
             return {
                 "vertex1": self.vertex1.to_json(),
                 "vertex2": self.vertex2.to_json(),
-                "path": self.navigation_path.to_json()
+                "path": self.navigation_path.to_json(resolution)
             }
 
 
@@ -130,121 +185,263 @@ class Graph:
     def add_edge_bidirectional(self, vertex1: Vertex, vertex2: Vertex, path: NavigationPath) -> None:
         """
         Add a bidirectional edge between two vertices
-        (Adds 2 edges, one for each direction)
+        (Adds 2 edges, one for each direction, sharing the path. Only the forward one is kept in self.edges)
         """
-        edge1 = vertex1.add_edge(vertex2, path)
-        edge2 = vertex2.add_edge(vertex1, path.flip())
-        self.edges.add(edge1)
-        self.edges.add(edge2)
+        edge = vertex1.add_edge(vertex2, path)
+        vertex2.add_edge(vertex1, path, reversed=True)
+        self.edges.add(edge)
         vertex1.neighbours.add(vertex2)
         vertex2.neighbours.add(vertex1)
 
 
-    def remove_edge_bidirectional(self, vertex1: Vertex, vertex2: Vertex) -> None:
-        """Remove bidirectional edges between two vertices"""
-        edges_to_remove = []
-        for edge in self.edges:
-            if {edge.vertex1, edge.vertex2} == {vertex1, vertex2}:
-                edges_to_remove.append(edge)
+    def get_edge(self, vertex1: Vertex, vertex2: Vertex) -> Optional[Edge]:
+        """Get the edge from vertex1 to vertex2 (None if they are not connected)"""
+        return vertex1.get_edge(vertex2)
 
-        for edge in edges_to_remove:
-            if edge in self.edges:
-                self.edges.remove(edge)
 
-            if edge.vertex1 == vertex1 and edge in vertex1.edges:
-                vertex1.edges.remove(edge)
-            elif edge.vertex1 == vertex2 and edge in vertex2.edges:
-                vertex2.edges.remove(edge)
+    def remove_edge_bidirectional(self, vertex1: Vertex, vertex2: Vertex) -> None:
+        """Remove bidirectional edges between two vertices (O(1), edges are looked up by neighbour)"""
+        edge = vertex1.remove_edge(vertex2)
+        reverse_edge = vertex2.remove_edge(vertex1)
+        vertex1.neighbours.discard(vertex2)
+        vertex2.neighbours.discard(vertex1)
 
-        if vertex2 in vertex1.neighbours:
-            vertex1.neighbours.remove(vertex2)
-        if vertex1 in vertex2.neighbours:
-            vertex2.neighbours.remove(vertex1)
+        # edges compare by their (unordered) vertices, so this removes whichever direction is stored
+        for removed in (edge, reverse_edge):
+            if removed is not None:
+                self.edges.discard(removed)
 
 
-    def export_json(self, filter_bidirectional: bool = True) -> str:
+    def export_json(self, filter_bidirectional: bool = True, resolution: Optional[float] = None) -> str:
         """Export the graph as a JSON string, with options for not saving bidirectional edges double"""
+        buffer = io.StringIO()
+        self.write_json(buffer, filter_bidirectional, resolution)
+        return buffer.getvalue()
 
-        # Helper function to remove reverse edges (to not save them, to save space -> save loading time later)
-        def remove_reverse_edges(edges: Set[Edge]) -> Set[Edge]:
-            seen = set()  # Set to keep track of seen edges
-            unique_edges = set()
 
-            for e in edges:
-                # Create a frozenset of the vertices to handle both directions equivalently
-                edge_tuple = frozenset([e.vertex1, e.vertex2])
+    def get_export_edges(self, filter_bidirectional: bool = True) -> List[Edge]:
+        """
+        Returns the edges to export, with filter_bidirectional only one edge per connection
+        (self.edges only holds the forward edges already), otherwise both directions.
+        """
+        if filter_bidirectional:
+            return list(self.edges)
+        return [edge for vertex in self.vertices.values() for edge in vertex.edges]
 
-                if edge_tuple not in seen:
-                    seen.add(edge_tuple)
-                    unique_edges.add(e)
 
-            return unique_edges
+    def get_vertex_indices(self) -> Dict[Vertex, int]:
+        """Returns the index each vertex has in the exported vertex list"""
+        return {vertex: index for index, vertex in enumerate(self.vertices.values())}
 
-        edges = list(self.edges)
-        if filter_bidirectional:
-            edges = remove_reverse_edges(self.edges)
 
-        # Use indices for vertices in the JSON output
-        vertices_list = []
+    def get_needed_rooms(self) -> Dict[int, "Room"]:
+        """Returns all rooms referenced by vertices (by room id, in order of first reference)"""
         needed_rooms = {}
-        for index, vertex in enumerate(self.vertices.values()):
-            vertices_list.append(vertex.to_json(index))
+        for vertex in self.vertices.values():
             for room in vertex.rooms:
                 needed_rooms[room.id] = room
+        return needed_rooms
 
 
-        # Use indices for edges in the JSON output
-        edges_list = []
-        for edge in edges:
-            # Look up vertex indices in the vertices list
-            # this can be done more efficiently (maybe by storing the index in the vertex object? but that's not very nice)
-            vertex1_index = list(self.vertices.values()).index(edge.vertex1)
-            vertex2_index = list(self.vertices.values()).index(edge.vertex2)
-            edges_list.append(edge.to_json(vertex1_index, vertex2_index))
-
-        # Construct and return JSON
-        return json.dumps({
-            "bidirectional": filter_bidirectional,
-            "vertices": vertices_list,
-            "edges": edges_list,
-            "rooms":  [room.to_minimal_json() for room in needed_rooms.values()]
-        })
+    def write_json(self, fileobj: TextIO, filter_bidirectional: bool = True, resolution: Optional[float] = None) -> None:
+        """
+        Streams the graph as JSON into a file object (same format as export_json),
+        with options for not saving bidirectional edges double.
+        If a resolution (in meters, e.g. 0.01) is given, path points and room outlines are written quantized
+        and delta encoded as flat integer lists (see quantize_points), the resolution is saved in the file.
+        """
+
+        def write_list(items: Iterable[Dict[str, Any]]) -> None:
+            """writes a JSON list item by item"""
+            fileobj.write("[")
+            for i, item in enumerate(items):
+                if i:
+                    fileobj.write(", ")
+                fileobj.write(json.dumps(item))
+            fileobj.write("]")
+
+        edges = self.get_export_edges(filter_bidirectional)
+
+        # Use indices for vertices in the JSON output (assigned once, for looking them up per edge)
+        vertex_indices = self.get_vertex_indices()
+        needed_rooms = self.get_needed_rooms()
+
+        fileobj.write(f'{{"bidirectional": {json.dumps(filter_bidirectional)}, ')
+        if resolution is not None:
+            fileobj.write(f'"resolution": {json.dumps(resolution)}, ')
+        fileobj.write('"vertices": ')
+        write_list(vertex.to_json(index) for vertex, index in vertex_indices.items())
+        fileobj.write(', "edges": ')
+        write_list(edge.to_json(vertex_indices[edge.vertex1], vertex_indices[edge.vertex2], resolution) for edge in edges)
+        fileobj.write(', "rooms": ')
+        write_list(room.to_minimal_json(resolution) for room in needed_rooms.values())
+        fileobj.write("}")
+
+
+    def export_split_json(self, filter_bidirectional: bool = True, resolution: Optional[float] = None) -> Tuple[str, bytes]:
+        """Export the graph as (topology JSON string, geometry bytes), see write_split_json"""
+        topology = io.StringIO()
+        geometry = io.BytesIO()
+        self.write_split_json(topology, geometry, filter_bidirectional, resolution)
+        return topology.getvalue(), geometry.getvalue()
+
+
+    def write_split_json(self, topology_fileobj: TextIO, geometry_fileobj: BinaryIO,
+                         filter_bidirectional: bool = True, resolution: Optional[float] = None) -> None:
+        """
+        Writes the graph split in two files, so routing data can be loaded before the (much larger) geometry:
+        - topology: like write_json, but edges only have "weight" instead of the path and rooms no outline.
+          Every edge and room has a "geometry": [byte offset, byte length] into the geometry file.
+        - geometry: one JSON object per line, {"points": [...]} for edges, {"outline": [...]} for rooms
+          (same point format as write_json, quantized if a resolution is given).
+        A single entry can be loaded with read_geometry.
+        """
+        edges = self.get_export_edges(filter_bidirectional)
+        vertex_indices = self.get_vertex_indices()
+        needed_rooms = self.get_needed_rooms()
 
+        offset = 0
 
-    def get_disconnected_components(self) -> List[Set[Vertex]]:
+        def write_geometry(item: Dict[str, Any]) -> List[int]:
+            """appends one geometry line and returns its [offset, length]"""
+            nonlocal offset
+            line = json.dumps(item).encode("utf-8") + b"\n"
+            geometry_fileobj.write(line)
+            offset += len(line)
+            return [offset - len(line), len(line)]
+
+        edge_entries = []
+        for edge in edges:
+            path = edge.navigation_path.to_json(resolution)
+            edge_entries.append({
+                "v1": vertex_indices[edge.vertex1],
+                "v2": vertex_indices[edge.vertex2],
+                "weight": path["weight"],
+                "geometry": write_geometry({"points": path["points"]})
+            })
+
+        room_entries = []
+        for room in needed_rooms.values():
+            room_json = room.to_minimal_json(resolution)
+            room_entries.append({
+                "id": room_json["id"],
+                "name": room_json["name"],
+                "geometry": write_geometry({"outline": room_json["outline"]})
+            })
+
+        topology = {"bidirectional": filter_bidirectional}
+        if resolution is not None:
+            topology["resolution"] = resolution
+        topology["vertices"] = [vertex.to_json(index) for vertex, index in vertex_indices.items()]
+        topology["edges"] = edge_entries
+        topology["rooms"] = room_entries
+        json.dump(topology, topology_fileobj)
+
+
+    def export_floor_tiles(self, filter_bidirectional: bool = True, resolution: Optional[float] = None) -> Tuple[Dict[int, Dict[str, Any]], Dict[str, Any]]:
         """
-        Returns a list of disconnected components in the graph.
-        Each component is a set of vertices that are connected to each other,
-        but not to vertices in other components.
+        Splits the graph export by floor, so the app only has to load the floors it shows / a route crosses.
+        Returns (tiles by floor, connectors):
+        - each tile has the same structure as export_json, but only the vertices, edges and rooms of that floor
+        - connectors lists the edges between floors (the stair connections), with the floor of both ends
+        Vertex ids are the same as in export_json (global over all tiles), so connectors can refer to them.
         """
+        vertex_indices = self.get_vertex_indices()
+        tiles: Dict[int, Dict[str, Any]] = {}
+
+        def get_tile(floor: int) -> Dict[str, Any]:
+            if floor not in tiles:
+                tiles[floor] = {"bidirectional": filter_bidirectional, "floor": floor}
+                if resolution is not None:
+                    tiles[floor]["resolution"] = resolution
+                tiles[floor].update({"vertices": [], "edges": [], "rooms": {}})
+            return tiles[floor]
+
+        for vertex, index in vertex_indices.items():
+            tile = get_tile(vertex.floor)
+            tile["vertices"].append(vertex.to_json(index))
+            for room in vertex.rooms:
+                tile["rooms"][room.id] = room
+
+        connectors = []
+        for edge in self.get_export_edges(filter_bidirectional):
+            edge_json = edge.to_json(vertex_indices[edge.vertex1], vertex_indices[edge.vertex2], resolution)
+            if edge.vertex1.floor == edge.vertex2.floor:
+                tiles[edge.vertex1.floor]["edges"].append(edge_json)
+            else:
+                edge_json["floor1"] = edge.vertex1.floor
+                edge_json["floor2"] = edge.vertex2.floor
+                connectors.append(edge_json)
+
+        for tile in tiles.values():
+            tile["rooms"] = [room.to_minimal_json(resolution) for room in tile["rooms"].values()]
+
+        connector_json = {
+            "bidirectional": filter_bidirectional,
+            "floors": sorted(tiles.keys()),
+            "edges": connectors
+        }
+        if resolution is not None:
+            connector_json["resolution"] = resolution
+        return dict(sorted(tiles.items())), connector_json
 
-        # Set of all unvisited vertices
-        unvisited = set(self.vertices.values())
-        components = []
 
-        # Keep exploring until we've visited all vertices
-        while unvisited:
-            # Start a new component with an arbitrary unvisited vertex
-            start_vertex = next(iter(unvisited))
-            component = set()
+    @staticmethod
+    def read_geometry(geometry_fileobj: BinaryIO, entry: List[int]) -> Dict[str, Any]:
+        """Loads one edge path / room outline from a geometry file, entry is the [offset, length] from the topology"""
+        offset, length = entry
+        geometry_fileobj.seek(offset)
+        return json.loads(geometry_fileobj.read(length))
 
-            # Use BFS to find all vertices in this component
-            queue = [start_vertex]
-            visited = {start_vertex}
 
+    def get_component_labels(self) -> Tuple[List[int], List[int]]:
+        """
+        Labels the connected components of the graph in O(V + E) (BFS over the vertex indices, see get_vertex_indices).
+        Returns (labels, sizes): labels[i] is the component of vertex i, sizes[c] the number of vertices in component c.
+        Vertices only reachable over edges (not in self.vertices, e.g. replaced by another vertex at the same position)
+        get the next indices when they are reached, so they are labelled after the graph vertices and counted in sizes.
+        """
+        vertex_indices = self.get_vertex_indices()
+        vertices = list(vertex_indices.keys())
+        labels = [-1] * len(vertices)
+        sizes = []
+
+        for start in range(len(vertices)):
+            if labels[start] != -1:
+                continue
+
+            # BFS from the first unlabelled vertex, everything reached gets the next label
+            label = len(sizes)
+            labels[start] = label
+            size = 0
+            queue = deque([start])
             while queue:
-                current = queue.pop(0)
-                component.add(current)
-
-                for neighbor in current.neighbours:
-                    if neighbor not in visited:
-                        visited.add(neighbor)
-                        queue.append(neighbor)
+                current = queue.popleft()
+                size += 1
+                for neighbour in vertices[current].neighbours:
+                    neighbour_index = vertex_indices.get(neighbour)
+                    if neighbour_index is None:
+                        neighbour_index = vertex_indices[neighbour] = len(vertices)
+                        vertices.append(neighbour)
+                        labels.append(-1)
+                    if labels[neighbour_index] == -1:
+                        labels[neighbour_index] = label
+                        queue.append(neighbour_index)
+            sizes.append(size)
+
+        return labels, sizes
 
-            # Add the component to our list and remove its vertices from unvisited
-            components.append(component)
-            unvisited -= component
 
+    def get_disconnected_components(self) -> List[Set[Vertex]]:
+        """
+        Returns a list of disconnected components in the graph.
+        Each component is a set of vertices that are connected to each other,
+        but not to vertices in other components.
+        """
+        labels, sizes = self.get_component_labels()
+        components: List[Set[Vertex]] = [set() for _ in sizes]
+        for vertex, label in zip(self.vertices.values(), labels):
+            components[label].add(vertex)
         return components
 
 
@@ -255,45 +452,107 @@ class Graph:
         (Used to remove broken parts of the graph, like rooms without doors / rooms only accessible from the outside)
         """
 
-        # Find all connected components
-        components = self.get_disconnected_components()
+        labels, sizes = self.get_component_labels()
 
         # If there are no components or only one component, nothing to do
-        if len(components) <= 1:
+        if len(sizes) <= 1:
             print("Graph already consists of a single component. No changes made.")
             return
 
-        # Find the largest component
-        largest_component = max(components, key=len)
+        largest = max(range(len(sizes)), key=sizes.__getitem__)
 
-        # Identify vertices to remove (all vertices not in the largest component)
-        vertices_to_remove = []
-        for position, vertex in self.vertices.items():
-            if vertex not in largest_component:
-                vertices_to_remove.append(position)
-
-        # Remove edges first (to avoid issues with missing vertices)
-        edges_to_remove = []
-        for edge in self.edges:
-            if edge.vertex1 not in largest_component or edge.vertex2 not in largest_component:
-                edges_to_remove.append(edge)
+        # only the removed vertices and their edges are touched,
+        # their neighbours are in the same (removed) component, so no neighbour sets of kept vertices change
+        removed_positions = [position for position, label in zip(self.vertices.keys(), labels) if label != largest]
+        for position in removed_positions:
+            vertex = self.vertices.pop(position)
+            for edge in vertex.edges:
+                self.edges.discard(edge)
 
-        for edge in edges_to_remove:
-            self.edges.remove(edge)
+        print(f"Removed {len(sizes) - 1} disconnected components ({len(removed_positions)} vertices)")
 
-            # Also remove the edge from the vertex edge lists
-            if edge in edge.vertex1.edges:
-                edge.vertex1.edges.remove(edge)
-            if edge in edge.vertex2.edges:
-                edge.vertex2.edges.remove(edge)
 
-        # Now remove vertices
-        for position in vertices_to_remove:
-            del self.vertices[position]
+    def simplify(self) -> Tuple[int, int]:
+        """
+        Optional pass before export, removes vertices routing doesn't need (distances between the kept vertices stay the same):
+        - vertices without rooms (stair centers) are merged into a neighbour on the same floor they are connected to with weight 0
+        - pass-through vertices with exactly two neighbours on the same floor are replaced by one edge, e.g. a door between
+          two rooms in a chain, as long as each of its rooms keeps another door (routes to such a room then end at another door)
+        The paths of the replaced edges are concatenated (through the position of the removed vertex), the weights summed.
+        Returns (removed vertices, removed edges)
+        """
+        vertex_count, edge_count = len(self.vertices), len(self.edges)
 
-        # Update the neighbors lists for all remaining vertices
+        door_counts: Dict[int, int] = {}
         for vertex in self.vertices.values():
-            vertex.neighbours = {n for n in vertex.neighbours if n in largest_component}
+            for room in vertex.rooms:
+                door_counts[room.id] = door_counts.get(room.id, 0) + 1
+
+        def is_in_graph(vertex: Vertex) -> bool:
+            return self.vertices.get((vertex.x, vertex.y, vertex.floor)) is vertex
+
+        for vertex in list(self.vertices.values()):
+            if vertex.rooms or not is_in_graph(vertex):
+                continue
+            target = next((neighbour for neighbour in vertex.neighbours if vertex.get_edge(neighbour).weight == 0 and neighbour.floor == vertex.floor), None)
+            if target is not None:
+                self._bypass_vertex(vertex, target)
+
+        # removing a pass-through vertex can make its neighbours pass-through vertices, so they are checked again
+        queue = deque(self.vertices.values())
+        while queue:
+            vertex = queue.popleft()
+            if not is_in_graph(vertex) or len(vertex.edges) != 2:
+                continue
+            first, second = vertex.neighbours
+            if first.floor != vertex.floor or second.floor != vertex.floor:
+                continue
+            if any(door_counts[room.id] < 2 for room in vertex.rooms):
+                continue
+
+            for room in vertex.rooms:
+                door_counts[room.id] -= 1
+            self._bypass_vertex(vertex, first)
+            queue.extend((first, second))
+
+        removed_vertices, removed_edges = vertex_count - len(self.vertices), edge_count - len(self.edges)
+        print(f"Simplified graph: removed {removed_vertices} vertices and {removed_edges} edges "
+              f"({len(self.vertices)} vertices, {len(self.edges)} edges left)")
+        return removed_vertices, removed_edges
+
+
+    def _bypass_vertex(self, vertex: Vertex, through: Vertex) -> None:
+        """
+        Removes a vertex, connecting `through` directly to each of its other neighbours (over the removed vertex).
+        Existing edges are only replaced if the new one is shorter.
+        """
+        head_edge = through.get_edge(vertex)
+        head = self._join_points(head_edge.get_points(), [(vertex.x, vertex.y)])
+
+        for edge in list(vertex.edges):
+            neighbour = edge.vertex2
+            if neighbour is through:
+                continue
+            weight = head_edge.weight + edge.weight
+            existing = through.get_edge(neighbour)
+            if existing is None or weight < existing.weight:
+                self.remove_edge_bidirectional(through, neighbour)
+                self.add_edge_bidirectional(through, neighbour, NavigationPath(weight, self._join_points(head, edge.get_points())))
+
+        for neighbour in list(vertex.neighbours):
+            self.remove_edge_bidirectional(vertex, neighbour)
+        del self.vertices[(vertex.x, vertex.y, vertex.floor)]
+
+
+    @staticmethod
+    def _join_points(*parts: Iterable[Tuple[float, float]]) -> List[Tuple[float, float]]:
+        """Concatenates paths, without repeating a point where one path ends and the next starts at the same position"""
+        points: List[Tuple[float, float]] = []
+        for part in parts:
+            for point in part:
+                if not points or tuple(point) != tuple(points[-1]):
+                    points.append(point)
+        return points
 
 
     def normalize_coordinates(self) -> None:
@@ -313,11 +572,16 @@ class Graph:
 
         self.vertices = new_vertices
 
+        # the vertex hashes changed with the coordinates, so the edge set and the adjacency sets have to be rehashed
+        # (otherwise lookups / removals by vertex or edge silently fail). Built from a list, as copying a set keeps the old hashes
+        self.edges = set(list(self.edges))
+        for vertex in self.vertices.values():
+            vertex.rehash()
 
-        # Also normalize the path coordinates in each edge
+        # Also normalize the path coordinates in each edge (the paths are shared with the reverse edges, so each is done once)
         for edge in self.edges:
-            if hasattr(edge.navigation_path, "points") and edge.navigation_path.points:
-                for i, point in enumerate(edge.navigation_path.points):
+            if hasattr(edge.path, "points") and edge.path.points:
+                for i, point in enumerate(edge.path.points):
                     if isinstance(point, tuple) and len(point) >= 2:
                         x, y = normalize_lat_lon_to_meter(point[0], point[1])
-                        edge.navigation_path.points[i] = (x, y)
\ No newline at end of file
+                        edge.path.points[i] = (x, y)
\ No newline at end of file
@@ -0,0 +1,214 @@
+import struct
+from dataclasses import dataclass
+from typing import BinaryIO, List, Tuple, Dict
+import numpy as np
+from coordinateUtilities import normalize_lat_lon_to_meter
+from graph import Graph
+
+# Compact binary version of the graph json, for loading it on the phone without parsing.
+# All values are little endian, every section starts 4 byte aligned. Layout (in this order):
+#   header              magic, version, flags, vertex / edge / room / point / string / vertex-room counts
+#   vertex_coords       float32[V, 2]   (lat, lon) like in the json
+#   vertex_floor        int32[V]
+#   vertex_name         uint32[V]       index into the string table
+#   vertex_room_offsets uint32[V + 1]   rooms of vertex i are vertex_rooms[offsets[i]:offsets[i + 1]]
+#   vertex_rooms        uint32[VR]      index into the room arrays
+#   adjacency_offsets   uint32[V + 1]   CSR adjacency, neighbours of vertex i are adjacency_*[offsets[i]:offsets[i + 1]]
+#   adjacency_targets   uint32[A]
+#   adjacency_edges     uint32[A]       edge index, REVERSED_BIT set if the edge is walked from v2 to v1
+#   edge_v1, edge_v2    uint32[E]
+#   edge_weight         float32[E]
+#   edge_point_offsets  uint32[E + 1]   path points of edge i are points[offsets[i]:offsets[i + 1]] (v1 -> v2)
+#   room_ids            int32[R]
+#   room_name           uint32[R]       index into the string table
+#   room_point_offsets  uint32[R + 1]   outline of room i is points[offsets[i]:offsets[i + 1]]
+#   points              float32[P, 2]   shared pool of (lat, lon) for paths and room outlines
+#   string_offsets      uint32[S + 1]
+#   strings             utf-8 bytes
+
+MAGIC = b"IGRB"
+VERSION = 1
+FLAG_BIDIRECTIONAL = 1
+REVERSED_BIT = 1 << 31
+
+_HEADER = struct.Struct("<4sHHIIIIII")
+
+
+@dataclass
+class BinaryGraph:
+    """The arrays of a binary graph file (see read_graph_binary)."""
+    bidirectional: bool
+    vertex_coords: np.ndarray
+    vertex_floor: np.ndarray
+    vertex_name: np.ndarray
+    vertex_room_offsets: np.ndarray
+    vertex_rooms: np.ndarray
+    adjacency_offsets: np.ndarray
+    adjacency_targets: np.ndarray
+    adjacency_edges: np.ndarray
+    edge_v1: np.ndarray
+    edge_v2: np.ndarray
+    edge_weight: np.ndarray
+    edge_point_offsets: np.ndarray
+    room_ids: np.ndarray
+    room_name: np.ndarray
+    room_point_offsets: np.ndarray
+    points: np.ndarray
+    strings: List[str]
+
+    def edge_points(self, edge_idx: int) -> np.ndarray:
+        """(lat, lon) points of the path of an edge (from v1 to v2)"""
+        return self.points[self.edge_point_offsets[edge_idx]:self.edge_point_offsets[edge_idx + 1]]
+
+    def room_outline(self, room_idx: int) -> np.ndarray:
+        """(lat, lon) points of the outline of a room"""
+        return self.points[self.room_point_offsets[room_idx]:self.room_point_offsets[room_idx + 1]]
+
+    def to_json(self) -> dict:
+        """Converts back to the structure of Graph.export_json (as far as the float32 precision goes)."""
+        def point_json(points: np.ndarray) -> List[Dict[str, float]]:
+            return [{"lat": lat, "lon": lon} for lat, lon in points.tolist()]
+
+        return {
+            "bidirectional": self.bidirectional,
+            "vertices": [{
+                "id": i,
+                "lat": float(self.vertex_coords[i, 0]),
+                "lon": float(self.vertex_coords[i, 1]),
+                "floor": int(self.vertex_floor[i]),
+                "name": self.strings[self.vertex_name[i]],
+                "rooms": [int(self.room_ids[r]) for r in self.vertex_rooms[self.vertex_room_offsets[i]:self.vertex_room_offsets[i + 1]]],
+            } for i in range(len(self.vertex_floor))],
+            "edges": [{
+                "v1": int(self.edge_v1[i]),
+                "v2": int(self.edge_v2[i]),
+                "path": {"weight": float(self.edge_weight[i]), "points": point_json(self.edge_points(i))},
+            } for i in range(len(self.edge_v1))],
+            "rooms": [{
+                "id": int(self.room_ids[i]),
+                "name": self.strings[self.room_name[i]],
+                "outline": point_json(self.room_outline(i)),
+            } for i in range(len(self.room_ids))],
+        }
+
+
+class _StringTable:
+    """Deduplicated strings (most vertices are just called "Door")."""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.indices: Dict[str, int] = {}
+
+    def add(self, string: str) -> int:
+        if string not in self.indices:
+            self.indices[string] = len(self.strings)
+            self.strings.append(string)
+        return self.indices[string]
+
+
+def write_graph_binary(graph: Graph, fileobj: BinaryIO, filter_bidirectional: bool = True) -> None:
+    """
+    Writes the graph in the compact binary format (same content as Graph.export_json).
+    Expects the coordinates to be normalized already.
+    """
+    edges = graph.get_export_edges(filter_bidirectional)
+    vertex_indices = graph.get_vertex_indices()
+    rooms = list(graph.get_needed_rooms().values())
+    room_indices = {room.id: i for i, room in enumerate(rooms)}
+    vertices = list(vertex_indices.keys())
+    strings = _StringTable()
+
+    vertex_coords = np.array([(v.y, v.x) for v in vertices], dtype=np.float32).reshape(-1, 2)
+    vertex_floor = np.array([v.floor for v in vertices], dtype=np.int32)
+    vertex_name = np.array([strings.add(v.name) for v in vertices], dtype=np.uint32)
+    vertex_room_lists = [[room_indices[r.id] for r in v.rooms] for v in vertices]
+    vertex_room_offsets = _offsets([len(r) for r in vertex_room_lists])
+    vertex_rooms = np.array([r for rooms_of_vertex in vertex_room_lists for r in rooms_of_vertex], dtype=np.uint32)
+
+    edge_v1 = np.array([vertex_indices[e.vertex1] for e in edges], dtype=np.uint32)
+    edge_v2 = np.array([vertex_indices[e.vertex2] for e in edges], dtype=np.uint32)
+    edge_weight = np.array([e.weight for e in edges], dtype=np.float32)
+
+    # paths and outlines share one point pool, paths first
+    point_lists: List[List[Tuple[float, float]]] = [[(lat, lon) for lon, lat in e.get_points()] for e in edges]
+    edge_point_offsets = _offsets([len(p) for p in point_lists])
+    room_point_lists = [[normalize_lat_lon_to_meter(x, y) for x, y in room.coordinates] for room in rooms]
+    room_point_offsets = _offsets([len(p) for p in room_point_lists]) + edge_point_offsets[-1]
+    points = np.array([p for points_of in point_lists + room_point_lists for p in points_of], dtype=np.float32).reshape(-1, 2)
+
+    room_ids = np.array([room.id for room in rooms], dtype=np.int32)
+    room_name = np.array([strings.add(room.name) for room in rooms], dtype=np.uint32)
+
+    # CSR adjacency, in the bidirectional case every edge is walkable in both directions
+    sources = [edge_v1]
+    targets = [edge_v2]
+    edge_refs = [np.arange(len(edges), dtype=np.uint32)]
+    if filter_bidirectional:
+        sources.append(edge_v2)
+        targets.append(edge_v1)
+        edge_refs.append(np.arange(len(edges), dtype=np.uint32) | np.uint32(REVERSED_BIT))
+    sources, targets, edge_refs = np.concatenate(sources), np.concatenate(targets), np.concatenate(edge_refs)
+    order = np.argsort(sources, kind="stable")
+    adjacency_targets = targets[order]
+    adjacency_edges = edge_refs[order]
+    adjacency_offsets = _offsets(np.bincount(sources, minlength=len(vertices)).tolist())
+
+    encoded = [string.encode("utf-8") for string in strings.strings]
+    string_offsets = _offsets([len(b) for b in encoded])
+
+    fileobj.write(_HEADER.pack(MAGIC, VERSION, FLAG_BIDIRECTIONAL if filter_bidirectional else 0,
+                               len(vertices), len(edges), len(rooms), len(points), len(encoded), len(vertex_rooms)))
+    for array in (vertex_coords, vertex_floor, vertex_name, vertex_room_offsets, vertex_rooms,
+                  adjacency_offsets, adjacency_targets, adjacency_edges,
+                  edge_v1, edge_v2, edge_weight, edge_point_offsets,
+                  room_ids, room_name, room_point_offsets, points, string_offsets):
+        fileobj.write(np.ascontiguousarray(array).tobytes())
+    fileobj.write(b"".join(encoded))
+
+
+def read_graph_binary(fileobj: BinaryIO) -> BinaryGraph:
+    """Reads a graph written by write_graph_binary."""
+    data = fileobj.read()
+    magic, version, flags, vertex_count, edge_count, room_count, point_count, string_count, vertex_room_count = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a binary graph file (version {VERSION})")
+
+    position = _HEADER.size
+
+    def take(dtype, count: int, width: int = 1) -> np.ndarray:
+        nonlocal position
+        array = np.frombuffer(data, dtype=dtype, count=count * width, offset=position)
+        position += array.nbytes
+        return array.reshape(-1, width) if width > 1 else array
+
+    vertex_coords = take(np.float32, vertex_count, 2)
+    vertex_floor = take(np.int32, vertex_count)
+    vertex_name = take(np.uint32, vertex_count)
+    vertex_room_offsets = take(np.uint32, vertex_count + 1)
+    vertex_rooms = take(np.uint32, vertex_room_count)
+    adjacency_offsets = take(np.uint32, vertex_count + 1)
+    adjacency_count = int(adjacency_offsets[-1])
+    adjacency_targets = take(np.uint32, adjacency_count)
+    adjacency_edges = take(np.uint32, adjacency_count)
+    edge_v1 = take(np.uint32, edge_count)
+    edge_v2 = take(np.uint32, edge_count)
+    edge_weight = take(np.float32, edge_count)
+    edge_point_offsets = take(np.uint32, edge_count + 1)
+    room_ids = take(np.int32, room_count)
+    room_name = take(np.uint32, room_count)
+    room_point_offsets = take(np.uint32, room_count + 1)
+    points = take(np.float32, point_count, 2)
+    string_offsets = take(np.uint32, string_count + 1)
+    string_bytes = data[position:]
+    strings = [string_bytes[string_offsets[i]:string_offsets[i + 1]].decode("utf-8") for i in range(string_count)]
+
+    return BinaryGraph(bool(flags & FLAG_BIDIRECTIONAL), vertex_coords, vertex_floor, vertex_name, vertex_room_offsets, vertex_rooms,
+                       adjacency_offsets, adjacency_targets, adjacency_edges, edge_v1, edge_v2, edge_weight, edge_point_offsets,
+                       room_ids, room_name, room_point_offsets, points, strings)
+
+
+def _offsets(counts: List[int]) -> np.ndarray:
+    """uint32 offsets (length + 1) from a list of counts"""
+    offsets = np.zeros(len(counts) + 1, dtype=np.uint32)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
@@ -0,0 +1,182 @@
+import io
+import json
+import math
+import random
+import struct
+import sys
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, BinaryIO, Callable
+
+import numpy as np
+
+from routing import RoutingGraph, Route, Location
+
+# Binary layout of exported landmark distances (little endian), k landmarks, V vertices:
+#   header          magic, version, value bits (16 / 32), k, V, scale (float32), error (float32)
+#   landmarks       int32[k]            vertex ids of the landmarks
+#   from_landmark   float[k, V]         distance landmark -> vertex, divided by scale (inf if unreachable)
+#   to_landmark     float[k, V]         distance vertex -> landmark, divided by scale
+# float16 values are scaled so the largest distance fits, error is the largest rounding error (in weight units).
+# A lower bound of the distance v -> t (ALT) is max over all landmarks L of
+#   max(from_landmark[L, t] - from_landmark[L, v], to_landmark[L, v] - to_landmark[L, t]) * scale - 2 * error
+
+MAGIC = b"IGLM"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIIff")
+
+
+@dataclass
+class Landmarks:
+    """Distances from / to a few landmark vertices, for A* with triangle inequality bounds (ALT)"""
+    vertices: np.ndarray            # landmark vertex ids
+    from_landmark: np.ndarray       # [k, V] float64
+    to_landmark: np.ndarray         # [k, V] float64
+    error: float = 0.0              # how much the distances might be off (rounding after export)
+
+
+    def heuristic(self, targets: Sequence[int]) -> Callable[[int], float]:
+        """Lower bound of the distance to the closest target, computed for all vertices at once"""
+        bounds = None
+        with np.errstate(invalid="ignore"):
+            for target in set(targets):
+                target_bounds = np.max(np.maximum(self.from_landmark[:, [target]] - self.from_landmark,
+                                                  self.to_landmark - self.to_landmark[:, [target]]), axis=0)
+                bounds = target_bounds if bounds is None else np.minimum(bounds, target_bounds)
+        # inf - inf (vertex and target both unreachable from a landmark) gives no information
+        bounds = np.nan_to_num(bounds, nan=0.0, posinf=math.inf) - 2 * self.error
+        return np.maximum(bounds, 0.0).tolist().__getitem__
+
+
+class LandmarkRouter:
+    """A* over a RoutingGraph with landmark bounds (same queries as RoutingGraph)"""
+
+    def __init__(self, routing_graph: RoutingGraph, landmarks: Landmarks):
+        self.routing_graph = routing_graph
+        self.landmarks = landmarks
+
+    def shortest_path(self, start: Location, goal: Location) -> Optional[Route]:
+        goal_vertex = self.routing_graph._resolve(goal)
+        return self.routing_graph.route_with_heuristic([self.routing_graph._resolve(start)], [goal_vertex], self.landmarks.heuristic([goal_vertex]))
+
+    def route_to_room(self, start: Location, room_name: str) -> Optional[Route]:
+        targets = self.routing_graph.room_vertices[room_name]
+        return self.routing_graph.route_with_heuristic([self.routing_graph._resolve(start)], targets, self.landmarks.heuristic(targets))
+
+
+def select_landmarks(routing_graph: RoutingGraph, count: int = 8, seed: int = 0) -> Landmarks:
+    """
+    Farthest point selection: every new landmark is the vertex farthest (by graph distance) from all landmarks so far.
+    To spread them over the building, it is picked from the floors with the fewest landmarks yet.
+    """
+    floors = routing_graph.floors
+    landmark_count = min(count, routing_graph.vertex_count)
+    vertices: List[int] = []
+    from_landmark: List[List[float]] = []
+    to_landmark: List[List[float]] = []
+
+    # start with the vertex farthest from a random one
+    start = random.Random(seed).randrange(routing_graph.vertex_count)
+    closest_distance = np.array(routing_graph.search_tree([start])[0])
+    landmarks_per_floor = {floor: 0 for floor in np.unique(floors).tolist()}
+
+    while len(vertices) < landmark_count:
+        fewest = min(landmarks_per_floor.values())
+        candidates = np.isin(floors, [floor for floor, landmarks in landmarks_per_floor.items() if landmarks == fewest])
+        # unreachable vertices can't be landmarks (they would bound nothing)
+        candidate_distance = np.where(candidates & np.isfinite(closest_distance), closest_distance, -1.0)
+        candidate_distance[vertices] = -1.0
+        landmark = int(np.argmax(candidate_distance))
+        if candidate_distance[landmark] < 0:
+            break
+
+        vertices.append(landmark)
+        landmarks_per_floor[int(floors[landmark])] += 1
+        from_landmark.append(routing_graph.search_tree([landmark])[0])
+        to_landmark.append(routing_graph.search_tree([landmark], reverse=True)[0])
+        closest_distance = np.minimum(closest_distance, from_landmark[-1]) if len(vertices) > 1 else np.array(from_landmark[-1])
+
+    return Landmarks(np.array(vertices, dtype=np.int32),
+                     np.array(from_landmark, dtype=np.float64).reshape(len(vertices), -1),
+                     np.array(to_landmark, dtype=np.float64).reshape(len(vertices), -1))
+
+
+def write_landmarks(landmarks: Landmarks, fileobj: BinaryIO, value_type: type = np.float16) -> None:
+    """Writes the landmark distances as float16 or float32 (layout at the top of this file)"""
+    value_type = np.dtype(value_type)
+    finite = np.concatenate([landmarks.from_landmark[np.isfinite(landmarks.from_landmark)],
+                             landmarks.to_landmark[np.isfinite(landmarks.to_landmark)]])
+    largest = float(finite.max()) if len(finite) else 1.0
+    # float16 only goes up to 65504 (and is most precise around 1), so the distances are scaled to that range
+    scale = largest / 60000.0 if value_type == np.float16 and largest > 0 else 1.0
+
+    arrays = [(landmarks.from_landmark / scale).astype(value_type), (landmarks.to_landmark / scale).astype(value_type)]
+    error = max(float(np.max(np.abs(array.astype(np.float64) * scale - original), initial=0.0, where=np.isfinite(original)))
+                for array, original in zip(arrays, (landmarks.from_landmark, landmarks.to_landmark)))
+
+    vertex_count = landmarks.from_landmark.shape[1]
+    fileobj.write(_HEADER.pack(MAGIC, VERSION, value_type.itemsize * 8, len(landmarks.vertices), vertex_count, scale, error))
+    fileobj.write(landmarks.vertices.astype(np.int32).tobytes())
+    for array in arrays:
+        fileobj.write(np.ascontiguousarray(array).tobytes())
+
+
+def read_landmarks(fileobj: BinaryIO) -> Landmarks:
+    """Reads landmarks written by write_landmarks (the rounding error is kept, so the bounds stay valid)"""
+    data = fileobj.read()
+    magic, version, bits, landmark_count, vertex_count, scale, error = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a landmark file (version {VERSION})")
+
+    value_type = np.float16 if bits == 16 else np.float32
+    position = _HEADER.size
+    vertices = np.frombuffer(data, dtype=np.int32, count=landmark_count, offset=position)
+    position += vertices.nbytes
+    arrays = []
+    for _ in range(2):
+        array = np.frombuffer(data, dtype=value_type, count=landmark_count * vertex_count, offset=position)
+        position += array.nbytes
+        arrays.append(array.astype(np.float64).reshape(landmark_count, vertex_count) * scale)
+    # float32 error of the header itself is covered by rounding it up a bit
+    return Landmarks(vertices, arrays[0], arrays[1], error * (1 + 1e-6))
+
+
+# selects landmarks for an exported graph and compares ALT to the other searches: python landmarks.py resources/{building}_graph.json [k] [queries]
+if __name__ == "__main__":
+    with open(sys.argv[1], encoding="utf-8") as f:
+        routing_graph = RoutingGraph.from_json(json.load(f))
+    landmark_count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    query_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    start_time = time.perf_counter()
+    landmarks = select_landmarks(routing_graph, landmark_count)
+    print(f"{len(landmarks.vertices)} landmarks on floors {sorted(routing_graph.floors[landmarks.vertices].tolist())} "
+          f"in {time.perf_counter() - start_time:.2f}s")
+
+    routers = {"alt float64": LandmarkRouter(routing_graph, landmarks)}
+    for value_type in (np.float32, np.float16):
+        landmark_file = io.BytesIO()
+        write_landmarks(landmarks, landmark_file, value_type)
+        loaded = read_landmarks(io.BytesIO(landmark_file.getvalue()))
+        routers[f"alt {np.dtype(value_type).name}"] = LandmarkRouter(routing_graph, loaded)
+        print(f"{np.dtype(value_type).name}: {len(landmark_file.getvalue()) / 1024:.1f} KiB, rounding error {loaded.error:.3g}")
+
+    random.seed(0)
+    rooms = sorted(routing_graph.room_vertices)
+    queries = [(random.randrange(routing_graph.vertex_count), random.choice(rooms)) for _ in range(query_count)]
+
+    reference = None
+    for name, query in [("dijkstra", lambda s, t: routing_graph.route_to_room(s, t, "dijkstra")),
+                        ("astar", lambda s, t: routing_graph.route_to_room(s, t, "astar"))] + \
+                       [(name, router.route_to_room) for name, router in routers.items()]:
+        query_start = time.perf_counter()
+        routes = [query(source, room) for source, room in queries]
+        elapsed = (time.perf_counter() - query_start) / len(queries)
+        settled = np.mean([route.settled for route in routes if route is not None])
+        reference = reference or routes
+        # unreachable rooms (None) have to be unreachable for both
+        mismatches = sum((a is None) != (b is None) or
+                         (a is not None and not math.isclose(a.path.weight, b.path.weight, rel_tol=1e-9, abs_tol=1e-12))
+                         for a, b in zip(reference, routes))
+        print(f"{name:<14} {1000 * elapsed:7.3f} ms/query, {settled:8.1f} vertices settled, {mismatches} mismatches")
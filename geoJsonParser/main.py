@@ -7,19 +7,31 @@ import coordinateUtilities
 import room
 from door import Door
 from graph import Graph
+from graphBinary import write_graph_binary
+from contractionHierarchy import build_contraction_hierarchy, write_contraction_hierarchy
 from parseObj import parse_obj_files
 from room import Room
+from routing import RoutingGraph
+from routingTable import build_routing_table, write_routing_table
+from landmarks import select_landmarks, write_landmarks
 from stairs import Stair
 import numpy as np
 
-matplotlib.use('TkAgg')
-
 # used to normalize the coordinates for unity
 #origin_lat=50.80977
 #origin_lon=8.81048
 origin_lat = -1
 origin_lon = -1
 
+# grid size (in meters) for the quantized graph export
+graph_resolution = 0.01
+
+# contract stair centers and pass-through doors before the export (smaller graph, same distances between the kept vertices)
+simplify_graph = False
+
+# precomputed routing data next to the graph (contraction hierarchy, routing table, landmarks), slow to build for big buildings, so opt-in
+build_routing_artifacts = False
+
 
 def parse_geojson_to_graph(geojson_string) -> tuple[Graph, list, list, list]:
     """
@@ -126,6 +138,8 @@ def visualize_level(rooms, stairs, level=3, max_features=10000):
 # will read all geojson from resources and make 3d models + graph + config file from them
 # for each geojson a folder will be created
 if __name__ == "__main__":
+    # only when run as a script (importing this module, e.g. for benchmarkMemory.py, shouldn't need a display)
+    matplotlib.use('TkAgg')
 
     geojson_folder = "resources"
 
@@ -146,11 +160,57 @@ if __name__ == "__main__":
 
         # Parse the GeoJSON to graph
         graph, rooms, stairs, doors = parse_geojson_to_graph(geojson_data)
+        if simplify_graph:
+            graph.simplify()
 
         # Save the graph JSON in the resources folder
         graph_path = os.path.join(geojson_folder, f"{building_name}_graph.json")
         with open(graph_path, "w") as f:
-            f.write(graph.export_json())
+            graph.write_json(f)
+
+        # quantized version of the same graph (path points and outlines on a 1cm grid, delta encoded)
+        quantized_graph_path = os.path.join(geojson_folder, f"{building_name}_graph_quantized.json")
+        with open(quantized_graph_path, "w") as f:
+            graph.write_json(f, resolution=graph_resolution)
+        full_size = os.path.getsize(graph_path)
+        quantized_size = os.path.getsize(quantized_graph_path)
+        print(f"graph json: {full_size / 1024:.1f} KiB, quantized ({graph_resolution}m): {quantized_size / 1024:.1f} KiB "
+              f"({100 * quantized_size / max(full_size, 1):.0f}%)")
+
+        # topology (for routing, loaded first) and geometry (loaded per edge / room when drawn) as separate files
+        with open(os.path.join(geojson_folder, f"{building_name}_graph_topology.json"), "w") as topology_file, \
+                open(os.path.join(geojson_folder, f"{building_name}_graph_geometry.jsonl"), "wb") as geometry_file:
+            graph.write_split_json(topology_file, geometry_file, resolution=graph_resolution)
+
+        # one graph tile per floor + the connections between the floors (stairs)
+        floor_tiles, floor_connectors = graph.export_floor_tiles(resolution=graph_resolution)
+        for level, tile in floor_tiles.items():
+            with open(os.path.join(geojson_folder, f"{building_name}_graph_floor{level}.json"), "w") as f:
+                json.dump(tile, f)
+        with open(os.path.join(geojson_folder, f"{building_name}_graph_connectors.json"), "w") as f:
+            json.dump(floor_connectors, f)
+
+        # compact binary version of the same graph (faster to load in the app)
+        with open(os.path.join(geojson_folder, f"{building_name}_graph.bin"), "wb") as f:
+            write_graph_binary(graph, f)
+
+        if build_routing_artifacts:
+            routing_graph = RoutingGraph.from_graph(graph)
+
+            # contraction hierarchy for fast routing (vertex ids are the ones of the graph json)
+            hierarchy = build_contraction_hierarchy(routing_graph)
+            print(f"contraction hierarchy: {len(hierarchy.arcs)} arcs ({hierarchy.shortcut_count} shortcuts)")
+            with open(os.path.join(geojson_folder, f"{building_name}_graph.ch"), "wb") as f:
+                write_contraction_hierarchy(hierarchy, f)
+
+            # precomputed routes between all rooms (answers "from my room to room X" with a lookup)
+            routing_table = build_routing_table(routing_graph, workers=os.cpu_count() or 1)
+            with open(os.path.join(geojson_folder, f"{building_name}_routing_table.bin"), "wb") as f:
+                write_routing_table(routing_table, f, routing_graph.vertex_count)
+
+            # landmark distances for A* (ALT), the lighter alternative to the routing table
+            with open(os.path.join(geojson_folder, f"{building_name}_landmarks.bin"), "wb") as f:
+                write_landmarks(select_landmarks(routing_graph, count=8), f, np.float16)
 
         # Create building-specific folder for OBJ files
         building_obj_folder = os.path.join(geojson_folder, building_name)
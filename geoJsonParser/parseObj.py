@@ -1,26 +1,43 @@
 import json
-import matplotlib
+import math
+import shapely
 from matplotlib import pyplot as plt
-from shapely.geometry.polygon import Polygon
+from shapely.geometry.polygon import Polygon, orient
 from shapely.ops import unary_union
 import coordinateUtilities
+from coordinateUtilities import normalize_lat_lon_to_meter
 from door import Door
 from room import Room
 from stairs import Stair
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Callable, Any
+from concurrent.futures import ProcessPoolExecutor
+import queue
+import threading
 from polygon import Polygon2D
 from wavefront import Wavefront
-
-matplotlib.use('TkAgg')
+from glbExport import write_glb
 
 import os
 
-def parse_obj_files(rooms: List[Door], stairs: List[Stair], doors: List[Door], source_filename, fileLocation) -> None:
+MESH_NAMES = ("walls", "ground", "doors")
+
+
+def parse_obj_files(rooms: List[Door], stairs: List[Stair], doors: List[Door], source_filename, fileLocation, compress: bool = False,
+                    glb: bool = False, merge_faces: bool = False, merged_walls: bool = False, workers: int = 1,
+                    write_queue_size: int = 3) -> None:
     """
     generates .obj files per floor, and a config .json with output paths.
     Expects the rooms to be already parsed and setup. (the graph doesn't need to be setup)
+    If compress is set, the .obj files are written gzip compressed (.obj.gz).
+    If glb is set, additionally one binary glTF per floor is written, containing walls, ground and doors.
+    If merge_faces is set, coplanar faces of the walls and ground are merged to reduce the face count.
+    If merged_walls is set, the walls are extruded from the footprint of the whole floor (see parse_merged_walls_obj_from_rooms).
+    With workers > 1 the meshes of all floors are built (and written) in parallel by a process pool.
+    Otherwise the files are written by a background thread, while the next meshes are computed,
+    write_queue_size limits how many finished meshes can wait for it (caps the memory used).
     """
     building_name = os.path.splitext(os.path.basename(source_filename))[0]
+    extension = "obj.gz" if compress else "obj"
 
     levels = sorted(set(room.level for room in rooms + stairs))
     output_config = {
@@ -29,35 +46,59 @@ def parse_obj_files(rooms: List[Door], stairs: List[Stair], doors: List[Door], s
         "floors": []
     }
 
+    floors: List[Tuple[int, List[Room], List[Door]]] = []
     for level in levels:
-        print(f"Processing level {level}")
         floor_rooms = [r for r in rooms + stairs if r.level == level and len(r.coordinates) > 3]
-        if not floor_rooms:
-            continue
-
-        floor_doors = [d for d in doors if d.level == level]
-        walls = parse_walls_obj_from_rooms(floor_rooms)
-        ground = parse_ground_floor_obj_from_rooms(floor_rooms)
-        doors_obj = parse_door_obj(floor_doors)
-
-        walls_file = f"{fileLocation}/{building_name}_floor{level}_walls.obj"
-        ground_file = f"{fileLocation}/{building_name}_floor{level}_ground.obj"
-        doors_file = f"{fileLocation}/{building_name}_floor{level}_doors.obj"
-
-
-        with open(walls_file, "w") as f:
-            f.write(str(walls))
-        with open(ground_file, "w") as f:
-            f.write(str(ground))
-        with open(doors_file, "w") as f:
-            f.write(str(doors_obj))
-
-        output_config["floors"].append({
-            "level": level,
-            "walls": os.path.basename(walls_file),
-            "ground": os.path.basename(ground_file),
-            "doors": os.path.basename(doors_file)
-        })
+        if floor_rooms:
+            floors.append((level, floor_rooms, [d for d in doors if d.level == level]))
+
+    def mesh_file(level: int, mesh_name: str) -> str:
+        return f"{fileLocation}/{building_name}_floor{level}_{mesh_name}.{extension}"
+
+    def glb_file(level: int) -> str:
+        return f"{fileLocation}/{building_name}_floor{level}.glb"
+
+    # the meshes are only needed afterwards for the glb file
+    options = dict(compress=compress, merge_faces=merge_faces, merged_walls=merged_walls, return_mesh=glb)
+
+    if workers > 1:
+        # each mesh of each floor is its own task, the origin has to be passed on (spawned processes don't have it)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_mesh_worker,
+                                 initargs=(coordinateUtilities.origin_lat, coordinateUtilities.origin_lon)) as pool:
+            futures = {
+                (level, mesh_name): pool.submit(_process_floor_mesh, mesh_name, level, floor_rooms, floor_doors, mesh_file(level, mesh_name), **options)
+                for level, floor_rooms, floor_doors in floors
+                for mesh_name in MESH_NAMES
+            }
+            for level, _, _ in floors:
+                floor_meshes = {mesh_name: futures[(level, mesh_name)].result() for mesh_name in MESH_NAMES}
+                if glb:
+                    write_glb(glb_file(level), floor_meshes)
+    else:
+        writer = BackgroundWriter(write_queue_size)
+        try:
+            for level, floor_rooms, floor_doors in floors:
+                print(f"Processing level {level}")
+                floor_meshes = {
+                    mesh_name: _process_floor_mesh(mesh_name, level, floor_rooms, floor_doors, mesh_file(level, mesh_name), writer=writer, **options)
+                    for mesh_name in MESH_NAMES
+                }
+                # written while the next floor is built
+                if glb:
+                    writer.submit(write_glb, glb_file(level), floor_meshes)
+        finally:
+            # also if building a mesh failed, so the writes queued so far are not lost
+            writer.close()
+
+    # config in level order, no matter in which order the floors were finished
+    for level, _, _ in floors:
+        floor_config = {"level": level}
+        for mesh_name in MESH_NAMES:
+            floor_config[mesh_name] = os.path.basename(mesh_file(level, mesh_name))
+        if glb:
+            floor_config["glb"] = os.path.basename(glb_file(level))
+
+        output_config["floors"].append(floor_config)
 
 
     config_file = f"resources/{building_name}_config.json"
@@ -69,6 +110,83 @@ def parse_obj_files(rooms: List[Door], stairs: List[Stair], doors: List[Door], s
     print("Done writing config:", config_file)
 
 
+def _init_mesh_worker(origin_lat: float, origin_lon: float) -> None:
+    """Sets up a mesh worker process (the origin for the coordinate normalization is a module global)."""
+    coordinateUtilities.origin_lat = origin_lat
+    coordinateUtilities.origin_lon = origin_lon
+
+
+def _process_floor_mesh(mesh_name: str, level: int, floor_rooms: List[Room], floor_doors: List[Door], filename: str,
+                        compress: bool, merge_faces: bool, merged_walls: bool, return_mesh: bool,
+                        writer: Optional["BackgroundWriter"] = None) -> Optional[Wavefront]:
+    """
+    Builds one mesh ("walls", "ground" or "doors") of a floor, optimizes and writes it (by the writer, if given).
+    Returns the mesh if return_mesh is set (otherwise None, so it doesn't have to be sent back from a worker).
+    """
+    if mesh_name == "walls":
+        if merged_walls:
+            mesh = parse_merged_walls_obj_from_rooms(floor_rooms, floor_doors)
+        else:
+            mesh = parse_walls_obj_from_rooms(floor_rooms)
+    elif mesh_name == "ground":
+        mesh = parse_ground_floor_obj_from_rooms(floor_rooms)
+    elif mesh_name == "doors":
+        mesh = parse_door_obj(floor_doors)
+    else:
+        raise ValueError(f"Unknown mesh {mesh_name}")
+
+    if merge_faces and mesh_name != "doors":
+        faces_before, faces_after, vertices_before, vertices_after = mesh.merge_coplanar_faces()
+        print(f"level {level} {mesh_name}: faces {faces_before} -> {faces_after}, vertices {vertices_before} -> {vertices_after}")
+
+    if writer:
+        writer.submit(mesh.save, filename, compress=compress)
+    else:
+        mesh.save(filename, compress=compress)
+    return mesh if return_mesh else None
+
+
+class BackgroundWriter:
+    """
+    Runs write calls (e.g. Wavefront.save) in a separate thread, so writing one mesh overlaps with computing the next.
+    The queue is bounded, submit() blocks if max_pending writes are already waiting.
+    """
+
+    def __init__(self, max_pending: int = 3):
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_pending))
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="mesh-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+
+            write_function, args, kwargs = task
+            if self._error is None:  # after an error the remaining writes are skipped
+                try:
+                    write_function(*args, **kwargs)
+                except BaseException as e:
+                    self._error = e
+
+    def submit(self, write_function: Callable[..., Any], *args, **kwargs) -> None:
+        """Queues a write call, raises the error of a previous write if one failed."""
+        self._raise_error()
+        self._queue.put((write_function, args, kwargs))
+
+    def close(self) -> None:
+        """Waits until all queued writes are done."""
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("writing a mesh failed") from self._error
+
+
 def write_default_mtl(filename: str):
     """
     Writes a basic MTL file with 'WhiteMaterial' and 'DarkMaterial'.
@@ -139,8 +257,72 @@ def parse_walls_obj_from_rooms(all_rooms: List['Room']) -> Wavefront:
     for outside_room in outside:
         outside_room.get_wavefront_walls(wavefront, outside=True, inside=False, top=True)
 
+    # walls of neighbouring rooms (and the outline) lie on top of each other
+    wavefront.remove_redundant_faces()
+
+    return wavefront
+
 
 
+def parse_merged_walls_obj_from_rooms(all_rooms: List['Room'], doors: Optional[List['Door']] = None,
+                                      height: float = 2.0, wall_thickness: float = 0.2, door_height: float = 1.8) -> Wavefront:
+    """
+    Alternative to parse_walls_obj_from_rooms: builds the wall footprint of the whole floor at once
+    (union of a band around every room outline) and extrudes it.
+    The door openings are only cut up to door_height, above them the wall is closed (lintel).
+    So every wall is in the mesh exactly once, no per room walls + outline that overlap.
+    """
+    wavefront = Wavefront()
+
+    def polygons_of(geometry) -> List[Polygon]:
+        # removing the tiny steps left over from the buffering / union
+        geometry = geometry.simplify(wavefront.merge_threshold / 2)
+        polygons = [geometry] if geometry.geom_type == "Polygon" else [g for g in getattr(geometry, "geoms", []) if g.geom_type == "Polygon"]
+        return [polygon for polygon in polygons if not polygon.is_empty]
+
+    def add_sides(polygon: Polygon, bottom: float, top: float) -> None:
+        # exterior clockwise and holes counter-clockwise, so the outside of the wall is always left of the ring direction
+        polygon = orient(polygon, -1.0)
+        for ring in [polygon.exterior] + list(polygon.interiors):
+            coords = list(ring.coords[:-1])
+
+            for i in range(len(coords)):
+                x, z = coords[i]
+                x1, z1 = coords[(i + 1) % len(coords)]
+                dx, dz = x1 - x, z1 - z
+                length = math.hypot(dx, dz)
+                if length == 0:
+                    continue
+
+                normal = (-dz / length, 0, dx / length)
+                wavefront.add_face([(x, bottom, z), (x1, bottom, z1), (x1, top, z1), (x, top, z)], [normal] * 4)
+
+    def add_cap(polygon: Polygon, y: float, up: bool) -> None:
+        # faces pointing up are clockwise in x/z, pointing down counter-clockwise
+        for triangle in shapely.constrained_delaunay_triangles(polygon).geoms:
+            coords = orient(triangle, -1.0 if up else 1.0).exterior.coords[:-1]
+            wavefront.add_face([(x, y, z) for x, z in coords], [(0, 1 if up else -1, 0)] * 3)
+
+    # band of wall_thickness around each outline (including holes), in meters
+    outlines = [room.get_meter_geometry().boundary for room in all_rooms]
+    footprint = unary_union(shapely.buffer(outlines, wall_thickness / 2, join_style="mitre")).simplify(wavefront.merge_threshold / 2)
+
+    openings = [Polygon([normalize_lat_lon_to_meter(x, y) for x, y in door.geometry]) for door in doors or [] if door.geometry]
+    if openings:
+        # below door_height the openings are cut out, above them the full footprint, closed at the bottom over each opening
+        opening_union = unary_union(openings)
+        for polygon in polygons_of(footprint.difference(opening_union)):
+            add_sides(polygon, 0.0, door_height)
+        for polygon in polygons_of(footprint.intersection(opening_union)):
+            add_cap(polygon, door_height, up=False)
+        bottom = door_height
+    else:
+        bottom = 0.0
+
+    for polygon in polygons_of(footprint):
+        add_sides(polygon, bottom, height)
+        add_cap(polygon, height, up=True)
+
     return wavefront
 
 
@@ -156,6 +338,8 @@ def parse_ground_floor_obj_from_rooms(rooms: List['Room']) -> Wavefront:
             polygon = Polygon2D.from_shapely(geometry)
             polygon.to_wavefront_triangulation(wavefront)
 
+    wavefront.remove_redundant_faces()
+
     return wavefront
 
 
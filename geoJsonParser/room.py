@@ -2,12 +2,12 @@ import math
 import random
 
 from nlopt import INVALID_ARGS
-from scipy.spatial import distance_matrix
+from scipy.spatial import cKDTree
 from typing import Tuple, List, Any, Dict, Optional
 import numpy as np
 from matplotlib import pyplot as plt
 from shapely.geometry.point import Point
-from coordinateUtilities import meters_to_latlon, normalize_lat_lon_to_meter
+from coordinateUtilities import meters_to_latlon, normalize_lat_lon_to_meter, quantize_points
 from dataClasses import PathVertex, BoundingBox, NavigationPath
 from door import Door
 import heapq
@@ -30,6 +30,9 @@ class Room:
     # has 2 values, as gps coordinates are not uniform (1 in lat != 1 in lon)
     wall_thickness: (float, float) = meters_to_latlon(0.3, 0.3, 50.8, 8.8)
 
+    # rings up to this many vertices are aligned by trying all pairs / rotations (faster than the kd-tree and fft for rectangles)
+    small_ring_size: int = 8
+
     def __init__(self, json: Dict[str, Any], graph: Graph):
         """
         :param json: JSON object containing the room data.
@@ -135,6 +138,20 @@ class Room:
     def __repr__(self):
         return f"Room (name={self.name}, level={self.level})"
 
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        Only the geometry is pickled (used for sending rooms to the mesh worker processes),
+        the graph, grid and doors would pull in the whole building.
+        """
+        state = self.__dict__.copy()
+        state["graph"] = None
+        state["grid"] = []
+        state["doors"] = []
+        for linked in ("vertex", "above", "below"):  # stairs
+            if linked in state:
+                state[linked] = None
+        return state
+
 
     def _compute_bounding_box(self) -> BoundingBox:
         """
@@ -164,66 +181,85 @@ class Room:
         return Polygon(coordinates, holes=holes)
 
 
-    def get_wavefront_walls(self, add_to_wavefront: "Wavefront", height: float = 2.0, outside=False, inside=True, top=True) -> None:
+    @staticmethod
+    def align_polygon_coords(inner_coords: List[Tuple[float, float]], outer_coords: List[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Creates an OBJ file representation of walls from room polygons.
-
+        aligns 2 rings, so the same indices are the closest points, will delete points of the longer one if the lengths don't match
+        (outer is an offset of inner, so each vertex is matched to its nearest one, and the rotation is the one with the smallest
+        sum of squared distances, from one cyclic cross-correlation -> O(n log n))
         """
-
-        def align_polygon_coords(inner_coords, outer_coords):
-            """alisn 2 lists, so the indices are the closest poins, will delete points, if lenth doesent match"""
-
-            inner_coords_np = np.array(inner_coords)
-            outer_coords_np = np.array(outer_coords)
-
-            # If different lengths, downsample the longer one by matching closest vertices
-            if len(inner_coords_np) != len(outer_coords_np):
-                if len(inner_coords_np) < len(outer_coords_np):
-                    shorter = inner_coords_np
-                    longer = outer_coords_np
-                else:
-                    shorter = outer_coords_np
-                    longer = inner_coords_np
-
-                # Compute distance matrix and pick closest matches
-                dists = distance_matrix(shorter, longer)
-                used_indices = set()
-                matches = []
-
-                for i in range(len(shorter)):
-                    idx = np.argmin(dists[i])
-                    while idx in used_indices:  # avoid duplicates
-                        dists[i][idx] = np.inf
-                        idx = np.argmin(dists[i])
-                    used_indices.add(idx)
+        inner_coords_np = np.array(inner_coords, dtype=np.float64)
+        outer_coords_np = np.array(outer_coords, dtype=np.float64)
+        small = max(len(inner_coords_np), len(outer_coords_np)) <= Room.small_ring_size
+
+        # If different lengths, downsample the longer one by matching closest vertices
+        if len(inner_coords_np) != len(outer_coords_np):
+            if len(inner_coords_np) < len(outer_coords_np):
+                shorter = inner_coords_np
+                longer = outer_coords_np
+            else:
+                shorter = outer_coords_np
+                longer = inner_coords_np
+
+            # each vertex of the shorter ring (in order) gets the closest vertex of the longer one not used yet
+            matches = []
+            if small:
+                dists = np.linalg.norm(shorter[:, None] - longer[None, :], axis=-1)
+                for row in dists:
+                    row[matches] = np.inf
+                    matches.append(int(np.argmin(row)))
+            else:
+                tree = cKDTree(longer)
+                _, nearest = tree.query(shorter)
+                used = np.zeros(len(longer), dtype=bool)
+                for point, idx in zip(shorter, nearest.tolist()):
+                    if used[idx]:
+                        # rare (the rings are offsets of each other), of the len(matches) + 1 closest vertices one is still unused
+                        _, candidates = tree.query(point, k=len(matches) + 1)
+                        idx = next(int(candidate) for candidate in candidates if not used[candidate])
+                    used[idx] = True
                     matches.append(idx)
 
-                matched_longer = longer[list(matches)]
+            matched_longer = longer[matches]
 
-                if len(inner_coords_np) < len(outer_coords_np):
-                    outer_coords_np = matched_longer
-                else:
-                    inner_coords_np = matched_longer
+            if len(inner_coords_np) < len(outer_coords_np):
+                outer_coords_np = matched_longer
+            else:
+                inner_coords_np = matched_longer
+
+        # Find best rotation (ties go to the first one: not reversed first, then by shift)
+        ring_size = len(outer_coords_np)
+        if small:
+            # total distance of every rotation, rotations[shift, i] = index of the outer vertex paired with inner vertex i
+            rotations = (np.arange(ring_size)[:, None] + np.arange(ring_size)[None, :]) % ring_size
+            rotated = np.concatenate([outer_coords_np[rotations], outer_coords_np[::-1][rotations]])
+            best = int(np.argmin(np.linalg.norm(rotated - inner_coords_np, axis=-1).sum(axis=1)))
+        else:
+            # sum of squared distances of every rotation = |inner|² + |outer|² - 2 * cross-correlation(inner, outer)
+            center = inner_coords_np.mean(axis=0)
+            inner_centered = inner_coords_np - center
+            inner_fft = np.conj(np.fft.rfft(inner_centered, axis=0))
+            scores = []
+            for reversed_flag in [False, True]:
+                outer_centered = (outer_coords_np[::-1] if reversed_flag else outer_coords_np) - center
+                correlation = np.fft.irfft(inner_fft * np.fft.rfft(outer_centered, axis=0), n=ring_size, axis=0).sum(axis=1)
+                scores.append((inner_centered ** 2).sum() + (outer_centered ** 2).sum() - 2 * correlation)
+            scores = np.concatenate(scores)
+            # (a small margin for the rounding of the fft, so exact ties still go to the first rotation)
+            best = int(np.flatnonzero(scores <= scores.min() + 1e-9 * max(1.0, float(np.abs(scores).max())))[0])
 
-            # Find best rotation (minimizing total distance)
-            min_total_dist = float('inf')
-            best_rotation = 0
-            best_reversed = False
+        best_reversed, best_rotation = divmod(best, ring_size)
+        aligned_outer = outer_coords_np[::-1] if best_reversed else outer_coords_np
+        aligned_outer = np.roll(aligned_outer, -best_rotation, axis=0)
 
-            for reversed_flag in [False, True]:
-                outer_to_test = outer_coords_np[::-1] if reversed_flag else outer_coords_np
-                for shift in range(len(outer_to_test)):
-                    rotated = np.roll(outer_to_test, -shift, axis=0)
-                    total_dist = np.linalg.norm(inner_coords_np - rotated, axis=1).sum()
-                    if total_dist < min_total_dist:
-                        min_total_dist = total_dist
-                        best_rotation = shift
-                        best_reversed = reversed_flag
+        return inner_coords_np, aligned_outer
 
-            aligned_outer = outer_coords_np[::-1] if best_reversed else outer_coords_np
-            aligned_outer = np.roll(aligned_outer, -best_rotation, axis=0)
 
-            return inner_coords_np, aligned_outer
+    def get_wavefront_walls(self, add_to_wavefront: "Wavefront", height: float = 2.0, outside=False, inside=True, top=True) -> None:
+        """
+        Creates an OBJ file representation of walls from room polygons.
+
+        """
 
         def is_clockwise(ring: List[Tuple[float, float]]) -> bool:
             """ checks if the list of tuples is in clockwise configuration"""
@@ -286,7 +322,7 @@ class Room:
         inner_polygon = list(inner_geom.exterior.coords[:-1])
         outer_polygon = list(outer_geom.exterior.coords[:-1])
 
-        inner_aligned, outer_aligned = align_polygon_coords(inner_polygon, outer_polygon)
+        inner_aligned, outer_aligned = Room.align_polygon_coords(inner_polygon, outer_polygon)
 
         if is_clockwise(inner_aligned):
             inner_aligned = list(reversed(inner_aligned))
@@ -1061,17 +1097,22 @@ class Room:
 
         return False
 
-    def to_minimal_json(self):
+    def to_minimal_json(self, resolution: Optional[float] = None):
         """
         Serialize the room to JSON containing the ID and the outline as custom Point objects.
+        If a resolution (in meters) is given, the outline is quantized and delta encoded instead (see quantize_points).
         """
+        outline = (normalize_lat_lon_to_meter(x, y) for x, y in self.coordinates)
+        if resolution is not None:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "outline": quantize_points(outline, resolution)
+            }
         return {
             "id": self.id,
             "name": self.name,
-            "outline": [
-                {"lat": lat, "lon": lon}
-                for lat, lon in (normalize_lat_lon_to_meter(x, y) for x, y in self.coordinates)
-            ]
+            "outline": [{"lat": lat, "lon": lon} for lat, lon in outline]
         }
 
 
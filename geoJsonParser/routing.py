@@ -0,0 +1,404 @@
+import heapq
+import json
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Optional, Union, Any, Sequence, Callable
+
+import numpy as np
+
+from coordinateUtilities import dequantize_points
+from dataClasses import NavigationPath
+from graph import Graph
+
+# a start / goal is either a vertex id or a position (x, y, floor), which is snapped to the closest vertex on that floor
+Location = Union[int, Tuple[float, float, int]]
+
+
+@dataclass
+class Route:
+    """Result of a routing query"""
+    vertices: List[int]         # vertex ids from start to goal
+    path: NavigationPath        # total weight + all points (vertices and edge paths) stitched together, as (x, y)
+    settled: int                # number of vertices the search settled (for comparing the search methods)
+
+
+class RoutingGraph:
+    """
+    Immutable compressed sparse row (CSR) version of a Graph for fast shortest path queries.
+    Vertex ids are the ones of the exported graph (Graph.get_vertex_indices), so they match the graph json.
+
+    Every directed edge is an arc, arc_* arrays are indexed by arc id.
+    The outgoing arcs of vertex v are out_*[out_offsets[v]:out_offsets[v + 1]] (incoming: in_*, for the backward search).
+    Edge paths are stored once in paths, arcs refer to them with arc_path (and arc_reversed if walked backwards).
+    """
+
+    def __init__(self, coordinates: np.ndarray, floors: np.ndarray, vertex_rooms: List[List[int]], room_names: Dict[int, str],
+                 arc_sources: np.ndarray, arc_targets: np.ndarray, arc_weights: np.ndarray,
+                 arc_paths: np.ndarray, arc_reversed: np.ndarray, paths: List[List[Tuple[float, float]]]):
+        self.coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)    # (x, y) per vertex
+        self.floors = np.asarray(floors, dtype=np.int32)
+        self.vertex_rooms = vertex_rooms
+        self.room_names = room_names
+        self.arc_sources = np.asarray(arc_sources, dtype=np.int32)
+        self.arc_targets = np.asarray(arc_targets, dtype=np.int32)
+        self.arc_weights = np.asarray(arc_weights, dtype=np.float64)
+        self.arc_paths = np.asarray(arc_paths, dtype=np.int32)
+        self.arc_reversed = np.asarray(arc_reversed, dtype=bool)
+        self.paths = paths
+
+        self.out_offsets, self.out_arcs = self._build_csr(self.arc_sources)
+        self.in_offsets, self.in_arcs = self._build_csr(self.arc_targets)
+
+        # rooms by name -> vertices (doors) of that room
+        self.room_vertices: Dict[str, List[int]] = {}
+        for vertex, room_ids in enumerate(vertex_rooms):
+            for room_id in room_ids:
+                vertices = self.room_vertices.setdefault(room_names[room_id], [])
+                if vertex not in vertices:
+                    vertices.append(vertex)
+
+        # A* needs a lower bound of the weight for the straight line distance.
+        # Weights and coordinates don't have the same unit, so the smallest ratio of all edges is used
+        # (0 if there are zero weight edges with a length, like stair centers to their doors -> A* = Dijkstra)
+        lengths = np.linalg.norm(self.coordinates[self.arc_sources] - self.coordinates[self.arc_targets], axis=1)
+        with_length = lengths > 0
+        self.heuristic_scale = float(np.min(self.arc_weights[with_length] / lengths[with_length])) if with_length.any() else 0.0
+
+        for array in (self.coordinates, self.floors, self.arc_sources, self.arc_targets, self.arc_weights, self.arc_paths,
+                      self.arc_reversed, self.out_offsets, self.out_arcs, self.in_offsets, self.in_arcs):
+            array.flags.writeable = False
+
+        # python lists of the CSR arrays, as indexing numpy arrays element wise is slow in the search loops
+        self._out = self._adjacency_lists(self.out_offsets, self.out_arcs, self.arc_targets)
+        self._in = self._adjacency_lists(self.in_offsets, self.in_arcs, self.arc_sources)
+        self._coordinates = self.coordinates.tolist()
+
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.floors)
+
+
+    @property
+    def arc_count(self) -> int:
+        return len(self.arc_sources)
+
+
+    def _build_csr(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """offsets (length V + 1) and arc ids sorted by the given arc endpoint"""
+        order = np.argsort(keys, kind="stable").astype(np.int32)
+        offsets = np.zeros(self.vertex_count + 1, dtype=np.int32)
+        np.cumsum(np.bincount(keys, minlength=self.vertex_count), out=offsets[1:])
+        return offsets, order
+
+
+    def _adjacency_lists(self, offsets: np.ndarray, arcs: np.ndarray, ends: np.ndarray) -> List[List[Tuple[int, float, int]]]:
+        """per vertex a list of (other vertex, weight, arc id)"""
+        ends_list = ends[arcs].tolist()
+        weights_list = self.arc_weights[arcs].tolist()
+        arcs_list = arcs.tolist()
+        offsets_list = offsets.tolist()
+        return [list(zip(ends_list[start:end], weights_list[start:end], arcs_list[start:end]))
+                for start, end in zip(offsets_list[:-1], offsets_list[1:])]
+
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> "RoutingGraph":
+        """Compiles a Graph (after normalize_coordinates) into the CSR representation"""
+        vertex_indices = graph.get_vertex_indices()
+        path_indices: Dict[int, int] = {}
+        paths: List[List[Tuple[float, float]]] = []
+        room_names: Dict[int, str] = {}
+        arcs: List[Tuple[int, int, float, int, bool]] = []
+
+        for vertex, index in vertex_indices.items():
+            for room in vertex.rooms:
+                room_names[room.id] = room.name
+            for edge in vertex.edges:
+                # both directions share one path, so it is only stored once
+                if id(edge.path) not in path_indices:
+                    path_indices[id(edge.path)] = len(paths)
+                    paths.append(list(edge.path.points))
+                arcs.append((index, vertex_indices[edge.vertex2], edge.weight, path_indices[id(edge.path)], edge.reversed))
+
+        sources, targets, weights, arc_paths, arc_reversed = zip(*arcs) if arcs else ((), (), (), (), ())
+        vertices = list(vertex_indices.keys())
+        return cls(np.array([(v.x, v.y) for v in vertices]), np.array([v.floor for v in vertices]),
+                   [[room.id for room in v.rooms] for v in vertices], room_names,
+                   np.array(sources), np.array(targets), np.array(weights), np.array(arc_paths), np.array(arc_reversed), paths)
+
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "RoutingGraph":
+        """Loads an exported graph (Graph.export_json, also quantized), e.g. json.load of a {building}_graph.json"""
+        resolution = data.get("resolution")
+        vertices = data["vertices"]
+
+        def read_points(points) -> List[Tuple[float, float]]:
+            if resolution is not None:
+                return [(lon, lat) for lat, lon in dequantize_points(points, resolution)]
+            return [(point["lon"], point["lat"]) for point in points]
+
+        sources, targets, weights, arc_paths, arc_reversed = [], [], [], [], []
+        paths = []
+        for edge in data["edges"]:
+            paths.append(read_points(edge["path"]["points"]))
+            directions = [(edge["v1"], edge["v2"], False)]
+            if data.get("bidirectional", True):
+                directions.append((edge["v2"], edge["v1"], True))
+            for source, target, reversed_direction in directions:
+                sources.append(source)
+                targets.append(target)
+                weights.append(edge["path"]["weight"])
+                arc_paths.append(len(paths) - 1)
+                arc_reversed.append(reversed_direction)
+
+        # vertex ids are the list positions
+        vertices = sorted(vertices, key=lambda v: v["id"])
+        return cls(np.array([(v["lon"], v["lat"]) for v in vertices]), np.array([v["floor"] for v in vertices]),
+                   [v["rooms"] for v in vertices], {room["id"]: room["name"] for room in data["rooms"]},
+                   np.array(sources, dtype=np.int32), np.array(targets, dtype=np.int32), np.array(weights),
+                   np.array(arc_paths, dtype=np.int32), np.array(arc_reversed, dtype=bool), paths)
+
+
+    def nearest_vertex(self, x: float, y: float, floor: int) -> int:
+        """Closest vertex to a position, on the same floor if there are vertices on it"""
+        candidates = np.flatnonzero(self.floors == floor)
+        if len(candidates) == 0:
+            candidates = np.arange(self.vertex_count)
+        distances = np.sum((self.coordinates[candidates] - (x, y)) ** 2, axis=1)
+        return int(candidates[np.argmin(distances)])
+
+
+    def _resolve(self, location: Location) -> int:
+        if isinstance(location, tuple):
+            return self.nearest_vertex(*location)
+        return int(location)
+
+
+    def shortest_path(self, start: Location, goal: Location, method: str = "bidirectional") -> Optional[Route]:
+        """
+        Shortest route between two vertices / positions, None if they are not connected.
+        method: "bidirectional" (bidirectional Dijkstra), "astar" (straight line heuristic) or "dijkstra"
+        """
+        return self._search([self._resolve(start)], [self._resolve(goal)], method)
+
+
+    def route_to_room(self, start: Location, room_name: str, method: str = "bidirectional") -> Optional[Route]:
+        """Shortest route to the closest door of the room with the given name (KeyError if there is no such room)"""
+        return self._search([self._resolve(start)], self.room_vertices[room_name], method)
+
+
+    def search_tree(self, sources: Sequence[int], reverse: bool = False) -> Tuple[List[float], List[int], List[int]]:
+        """
+        Dijkstra from all sources to every vertex (with reverse: from every vertex to the sources, over the incoming arcs).
+        Returns per vertex (distance, source the shortest route starts at, first vertex after that source),
+        inf / -1 / -1 for unreachable vertices, first vertex -1 for the sources themselves.
+        """
+        adjacency = self._in if reverse else self._out
+        distances = [math.inf] * self.vertex_count
+        origins = [-1] * self.vertex_count
+        first_hops = [-1] * self.vertex_count
+        settled = [False] * self.vertex_count
+        for source in sources:
+            distances[source] = 0.0
+            origins[source] = source
+        queue = [(0.0, source) for source in sources]
+        heapq.heapify(queue)
+
+        while queue:
+            distance, vertex = heapq.heappop(queue)
+            if settled[vertex]:
+                continue
+            settled[vertex] = True
+            for neighbour, weight, _ in adjacency[vertex]:
+                new_distance = distance + weight
+                if new_distance < distances[neighbour]:
+                    distances[neighbour] = new_distance
+                    origins[neighbour] = origins[vertex]
+                    first_hops[neighbour] = neighbour if first_hops[vertex] == -1 else first_hops[vertex]
+                    heapq.heappush(queue, (new_distance, neighbour))
+
+        return distances, origins, first_hops
+
+
+    def _search(self, sources: Sequence[int], targets: Sequence[int], method: str) -> Optional[Route]:
+        if method == "bidirectional":
+            result = self._bidirectional_dijkstra(sources, targets)
+        elif method == "astar":
+            result = self._astar(sources, targets, self._straight_line_heuristic(targets))
+        elif method == "dijkstra":
+            result = self._astar(sources, targets, lambda vertex: 0.0)
+        else:
+            raise ValueError(f"Unknown routing method: {method}")
+
+        if result is None:
+            return None
+        distance, arcs, settled = result
+        return self._make_route(sources, distance, arcs, settled)
+
+
+    def route_with_heuristic(self, sources: Sequence[int], targets: Sequence[int], heuristic: Callable[[int], float]) -> Optional[Route]:
+        """A* from the source vertices to the closest target vertex with a custom heuristic (e.g. landmarks, see _astar)"""
+        result = self._astar(sources, targets, heuristic)
+        if result is None:
+            return None
+        distance, arcs, settled = result
+        return self._make_route(sources, distance, arcs, settled)
+
+
+    def _straight_line_heuristic(self, targets: Sequence[int]) -> Callable[[int], float]:
+        """lower bound of the distance to the closest target from the straight line distance (see heuristic_scale)"""
+        target_coordinates = [self._coordinates[t] for t in set(targets)]
+        coordinates = self._coordinates
+        scale = self.heuristic_scale
+
+        def heuristic(vertex: int) -> float:
+            if scale == 0.0:
+                return 0.0
+            x, y = coordinates[vertex]
+            return scale * min(math.hypot(x - tx, y - ty) for tx, ty in target_coordinates)
+
+        return heuristic
+
+
+    def _astar(self, sources: Sequence[int], targets: Sequence[int], heuristic: Callable[[int], float]) -> Optional[Tuple[float, List[int], int]]:
+        """
+        A* from all sources to the closest target, returns (distance, arcs of the route, settled).
+        The heuristic has to be a lower bound of the distance to the closest target (constant 0 = Dijkstra).
+        It doesn't have to be consistent (e.g. rounded landmark distances): a vertex reached again over a shorter route
+        after it was expanded is expanded again.
+        """
+        target_set = set(targets)
+        distances: Dict[int, float] = {}
+        parent_arcs: Dict[int, int] = {}
+        settled = set()
+        queue = []
+        for source in sources:
+            distances[source] = 0.0
+            queue.append((heuristic(source), 0.0, source))
+        heapq.heapify(queue)
+
+        while queue:
+            _, queued_distance, vertex = heapq.heappop(queue)
+            if queued_distance > distances[vertex]:
+                continue    # outdated entry, the vertex was queued again with a shorter distance
+            settled.add(vertex)
+
+            if vertex in target_set:
+                return distances[vertex], self._trace(parent_arcs, vertex, self.arc_sources), len(settled)
+
+            distance = distances[vertex]
+            for neighbour, weight, arc in self._out[vertex]:
+                new_distance = distance + weight
+                if new_distance < distances.get(neighbour, math.inf):
+                    distances[neighbour] = new_distance
+                    parent_arcs[neighbour] = arc
+                    heapq.heappush(queue, (new_distance + heuristic(neighbour), new_distance, neighbour))
+
+        return None
+
+
+    def _bidirectional_dijkstra(self, sources: Sequence[int], targets: Sequence[int]) -> Optional[Tuple[float, List[int], int]]:
+        """
+        Dijkstra from the sources (forward) and the targets (backward, over the incoming arcs) at the same time,
+        always expanding the side with the smaller queue minimum, until both minima together can't beat the best route.
+        """
+        distances = ({s: 0.0 for s in sources}, {t: 0.0 for t in targets})
+        parent_arcs: Tuple[Dict[int, int], Dict[int, int]] = ({}, {})
+        settled = (set(), set())
+        queues = ([(0.0, s) for s in distances[0]], [(0.0, t) for t in distances[1]])
+        adjacency = (self._out, self._in)
+
+        best = math.inf
+        meeting = None
+        for vertex in distances[0]:
+            if vertex in distances[1]:
+                best, meeting = 0.0, vertex
+
+        while queues[0] and queues[1] and queues[0][0][0] + queues[1][0][0] < best:
+            side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+            distance, vertex = heapq.heappop(queues[side])
+            if vertex in settled[side]:
+                continue
+            settled[side].add(vertex)
+
+            own_distances, other_distances = distances[side], distances[1 - side]
+            for neighbour, weight, arc in adjacency[side][vertex]:
+                new_distance = distance + weight
+                if new_distance < own_distances.get(neighbour, math.inf):
+                    own_distances[neighbour] = new_distance
+                    parent_arcs[side][neighbour] = arc
+                    heapq.heappush(queues[side], (new_distance, neighbour))
+                if neighbour in other_distances and new_distance + other_distances[neighbour] < best:
+                    best = new_distance + other_distances[neighbour]
+                    meeting = neighbour
+
+        if meeting is None:
+            return None
+
+        # forward arcs up to the meeting vertex, then the backward search tree down to the target
+        arcs = self._trace(parent_arcs[0], meeting, self.arc_sources)
+        vertex = meeting
+        while vertex in parent_arcs[1]:
+            arc = parent_arcs[1][vertex]
+            arcs.append(arc)
+            vertex = int(self.arc_targets[arc])
+        return best, arcs, len(settled[0]) + len(settled[1])
+
+
+    @staticmethod
+    def _trace(parent_arcs: Dict[int, int], vertex: int, arc_sources: np.ndarray) -> List[int]:
+        """arcs from the search start to the vertex"""
+        arcs = []
+        while vertex in parent_arcs:
+            arc = parent_arcs[vertex]
+            arcs.append(arc)
+            vertex = int(arc_sources[arc])
+        arcs.reverse()
+        return arcs
+
+
+    def _make_route(self, sources: Sequence[int], distance: float, arcs: List[int], settled: int) -> Route:
+        """Stitches the vertices and edge paths of the arcs together"""
+        vertices = [int(self.arc_sources[arcs[0]])] if arcs else [sources[0]]
+        points = [tuple(self._coordinates[vertices[0]])]
+        for arc in arcs:
+            path = self.paths[self.arc_paths[arc]]
+            points.extend(reversed(path) if self.arc_reversed[arc] else path)
+            vertices.append(int(self.arc_targets[arc]))
+            points.append(tuple(self._coordinates[vertices[-1]]))
+        return Route(vertices, NavigationPath(weight=distance, points=points), settled)
+
+
+# compares the routing methods on an exported graph: python routing.py resources/{building}_graph.json [queries]
+if __name__ == "__main__":
+    with open(sys.argv[1], encoding="utf-8") as f:
+        routing_graph = RoutingGraph.from_json(json.load(f))
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"{routing_graph.vertex_count} vertices, {routing_graph.arc_count} arcs, {len(routing_graph.room_vertices)} rooms")
+
+    random.seed(0)
+    rooms = sorted(routing_graph.room_vertices)
+    queries = [(random.randrange(routing_graph.vertex_count), random.choice(rooms)) for _ in range(query_count)]
+
+    results = {}
+    for method in ("dijkstra", "astar", "bidirectional"):
+        start = time.perf_counter()
+        routes = [routing_graph.route_to_room(vertex, room, method) for vertex, room in queries]
+        elapsed = time.perf_counter() - start
+        results[method] = routes
+        settled = np.mean([route.settled for route in routes if route is not None])
+        print(f"{method:<14} {1000 * elapsed / query_count:7.3f} ms/query, {settled:8.1f} vertices settled")
+
+    mismatches = sum(
+        (a is None) != (b is None) or (a is not None and not math.isclose(a.path.weight, b.path.weight, rel_tol=1e-9, abs_tol=1e-12))
+        for a, b in zip(results["dijkstra"], results["bidirectional"])
+    ) + sum(
+        (a is None) != (b is None) or (a is not None and not math.isclose(a.path.weight, b.path.weight, rel_tol=1e-9, abs_tol=1e-12))
+        for a, b in zip(results["dijkstra"], results["astar"])
+    )
+    print("mismatches:", mismatches)
@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, Any, List, Tuple
+
+from routingService import RoutingService
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str, body: Any = None) -> Dict[str, Any]:
+    """One request over a kept alive connection to the routing service"""
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    response = json.loads(await reader.readexactly(int(headers["content-length"])))
+    if b" 200 " not in status_line:
+        raise RuntimeError(f"{status_line.decode().strip()}: {response}")
+    return response
+
+
+async def run_client(host: str, port: int, building: str, queries: List[Tuple[int, str]], requests: int, batch_size: int,
+                     rng: random.Random, latencies: List[float]) -> None:
+    """One connection sending requests one after another, each with batch_size random queries"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            batch = [{"start": start, "room": room} for start, room in rng.choices(queries, k=batch_size)]
+            start_time = time.perf_counter()
+            await request(reader, writer, "POST", "/route", {"building": building, "queries": batch})
+            latencies.append(time.perf_counter() - start_time)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def load_test(args: argparse.Namespace) -> None:
+    server = None
+    if args.folder:
+        # service in this process (shares the CPU with the clients, the numbers are a lower bound)
+        service = RoutingService.load(args.folder, args.cache_size)
+        server = await asyncio.start_server(service.handle_connection, args.host, args.port)
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    buildings = await request(reader, writer, "GET", "/buildings")
+    building = args.building or next(iter(buildings))
+    info = buildings[building]
+
+    # the queries are drawn from a fixed set, so repeated ones hit the cache (like many people going to the same rooms)
+    rng = random.Random(args.seed)
+    queries = [(rng.randrange(info["vertices"]), rng.choice(info["rooms"])) for _ in range(args.distinct)]
+
+    latencies: List[float] = []
+    start_time = time.perf_counter()
+    await asyncio.gather(*(run_client(args.host, args.port, building, queries, args.requests, args.batch,
+                                      random.Random(args.seed + 1 + client), latencies)
+                           for client in range(args.connections)))
+    elapsed = time.perf_counter() - start_time
+
+    stats = (await request(reader, writer, "GET", "/stats"))[building]
+    writer.close()
+    await writer.wait_closed()
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+    request_count = len(latencies)
+    print(f"{building} ({info['engine']}): {request_count} requests x {args.batch} queries over {args.connections} connections "
+          f"in {elapsed:.2f}s")
+    print(f"throughput {request_count / elapsed:.1f} requests/s, {request_count * args.batch / elapsed:.1f} queries/s")
+    print(f"latency p50 {1000 * percentile(latencies, 0.5):.2f} ms, p99 {1000 * percentile(latencies, 0.99):.2f} ms")
+    print(f"cache: {stats['cached']} routes, {stats['hits']} hits, {stats['misses']} misses")
+
+
+# python routingLoadTest.py [--folder resources] [--connections 8] [--requests 100] [--batch 10]
+# (without --folder a running routingService.py is tested)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency of the routing service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--folder", help="start the service in this process, with the graphs of this folder")
+    parser.add_argument("--cache-size", type=int, default=10000, help="cached routes per building (with --folder)")
+    parser.add_argument("--building", help="building to query (default: the first one)")
+    parser.add_argument("--connections", type=int, default=8, help="concurrent connections")
+    parser.add_argument("--requests", type=int, default=100, help="requests per connection")
+    parser.add_argument("--batch", type=int, default=10, help="queries per request")
+    parser.add_argument("--distinct", type=int, default=2000, help="number of different queries the requests are drawn from")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(load_test(parser.parse_args()))
@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, List, Union
+
+from contractionHierarchy import ContractionHierarchy, read_contraction_hierarchy
+from landmarks import LandmarkRouter, read_landmarks, select_landmarks
+from routing import RoutingGraph, Route
+
+# Local HTTP routing service (stdlib only), for devices without the app (kiosks, web front end).
+#   GET  /buildings     {building: {"vertices": count, "rooms": [names], "engine": name}}
+#   GET  /stats         cache size / hits / misses per building
+#   POST /route         {"building": name, "queries": [{"start": vertex id or [x, y, floor], "room": name}, ...]}
+#                       -> {"routes": [{"start", "room", "distance", "vertices", "points": [[x, y], ...]} or {"error"}, ...]}
+# Connections are kept alive (HTTP/1.1), so clients can send many requests over one connection.
+# Requests are answered in a thread pool, so a long routing request doesn't block the other connections.
+
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class RouteCache:
+    """
+    LRU cache of route results, keyed by (start vertex, room name), evicts the least recently used above max_entries
+    (thread safe, the requests are handled in a thread pool)
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Tuple[int, str], Dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[int, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple[int, str], entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class BuildingRouter:
+    """Routing for one building: the graph, the fastest engine available for it and its route cache"""
+
+    def __init__(self, routing_graph: RoutingGraph, engine: Union[ContractionHierarchy, LandmarkRouter], cache_size: int):
+        self.routing_graph = routing_graph
+        self.engine = engine
+        self.cache = RouteCache(cache_size)
+
+    @classmethod
+    def load(cls, graph_path: str, cache_size: int) -> "BuildingRouter":
+        """
+        Loads a {building}_graph.json, with the contraction hierarchy ({building}_graph.ch) written next to it if there is one,
+        otherwise A* with landmarks ({building}_landmarks.bin, or selected now)
+        """
+        with open(graph_path, encoding="utf-8") as f:
+            routing_graph = RoutingGraph.from_json(json.load(f))
+
+        hierarchy_path = graph_path[:-len(".json")] + ".ch"
+        landmarks_path = graph_path[:-len("_graph.json")] + "_landmarks.bin"
+        if os.path.exists(hierarchy_path):
+            with open(hierarchy_path, "rb") as f:
+                engine = read_contraction_hierarchy(f, routing_graph)
+        elif os.path.exists(landmarks_path):
+            with open(landmarks_path, "rb") as f:
+                engine = LandmarkRouter(routing_graph, read_landmarks(f))
+        else:
+            engine = LandmarkRouter(routing_graph, select_landmarks(routing_graph))
+        return cls(routing_graph, engine, cache_size)
+
+    @property
+    def engine_name(self) -> str:
+        return "contraction hierarchy" if isinstance(self.engine, ContractionHierarchy) else "landmarks"
+
+    def route(self, start: Union[int, List[float]], room_name: str) -> Dict[str, Any]:
+        """Route from a vertex id / [x, y, floor] position to a room, as JSON (positions are snapped to the closest vertex first)"""
+        if room_name not in self.routing_graph.room_vertices:
+            return {"error": f"Unknown room: {room_name}"}
+        if isinstance(start, list):
+            x, y, floor = start
+            start_vertex = self.routing_graph.nearest_vertex(x, y, int(floor))
+        else:
+            start_vertex = int(start)
+            if not 0 <= start_vertex < self.routing_graph.vertex_count:
+                return {"error": f"Unknown vertex: {start_vertex}"}
+
+        key = (start_vertex, room_name)
+        result = self.cache.get(key)
+        if result is None:
+            result = self._route_json(start_vertex, room_name, self.engine.route_to_room(start_vertex, room_name))
+            self.cache.put(key, result)
+        return result
+
+    @staticmethod
+    def _route_json(start_vertex: int, room_name: str, route: Optional[Route]) -> Dict[str, Any]:
+        if route is None:
+            return {"start": start_vertex, "room": room_name, "error": "No route to the room"}
+        return {"start": start_vertex, "room": room_name, "distance": route.path.weight, "vertices": route.vertices,
+                "points": [[x, y] for x, y in route.path.points]}
+
+
+class RoutingService:
+    """Answers the HTTP requests (see the top of this file) for the loaded buildings"""
+
+    def __init__(self, buildings: Dict[str, BuildingRouter]):
+        self.buildings = buildings
+
+    @classmethod
+    def load(cls, folder: str, cache_size: int) -> "RoutingService":
+        """Loads all {building}_graph.json files of a folder (e.g. the resources folder main.py writes to)"""
+        buildings = {}
+        for graph_path in sorted(glob.glob(os.path.join(folder, "*_graph.json"))):
+            building_name = os.path.basename(graph_path)[:-len("_graph.json")]
+            start = time.perf_counter()
+            buildings[building_name] = BuildingRouter.load(graph_path, cache_size)
+            print(f"loaded {building_name}: {buildings[building_name].routing_graph.vertex_count} vertices, "
+                  f"{buildings[building_name].engine_name} ({time.perf_counter() - start:.2f}s)")
+        return cls(buildings)
+
+    def handle(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        """(status code, response JSON) for one request"""
+        if method == "GET" and path == "/buildings":
+            return 200, {name: {"vertices": building.routing_graph.vertex_count, "rooms": sorted(building.routing_graph.room_vertices),
+                                "engine": building.engine_name}
+                         for name, building in self.buildings.items()}
+        if method == "GET" and path == "/stats":
+            return 200, {name: {"cached": len(building.cache), "hits": building.cache.hits, "misses": building.cache.misses}
+                         for name, building in self.buildings.items()}
+        if method != "POST" or path != "/route":
+            return 404, {"error": f"Unknown endpoint: {method} {path}"}
+
+        try:
+            request = json.loads(body)
+            building = self.buildings.get(request["building"])
+            if building is None:
+                return 404, {"error": f"Unknown building: {request['building']}"}
+            return 200, {"routes": [building.route(query["start"], query["room"]) for query in request["queries"]]}
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": f"Invalid route request: {e!r}"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Minimal HTTP/1.1: requests with a Content-Length body, kept alive until the client closes the connection"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    status, response = 413, {"error": "Request too large"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    # routing is CPU bound, so it runs in the default thread pool (see the top of this file)
+                    status, response = await loop.run_in_executor(None, self.handle, method, path, body)
+                    keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                payload = json.dumps(response).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass    # malformed request / client gone, the connection is just closed
+        finally:
+            writer.close()
+
+
+async def serve(service: RoutingService, host: str, port: int) -> None:
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"routing service on http://{host}:{port} ({', '.join(service.buildings)})")
+    async with server:
+        await server.serve_forever()
+
+
+# python routingService.py resources [--port 8080] [--cache-size 10000]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP service for routes to rooms")
+    parser.add_argument("folder", help="folder with the {building}_graph.json files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cache-size", type=int, default=10000, help="cached routes per building")
+    args = parser.parse_args()
+
+    asyncio.run(serve(RoutingService.load(args.folder, args.cache_size), args.host, args.port))
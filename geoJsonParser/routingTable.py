@@ -0,0 +1,169 @@
+import io
+import json
+import math
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Optional, BinaryIO
+
+import numpy as np
+
+from routing import RoutingGraph
+
+# Binary layout of a room-to-room routing table (little endian), R = number of rooms:
+#   header      magic, version, room count, vertex count
+#   room_ids    int32[R]        ids of the rooms (like in the graph json), rows / columns of the matrices are in this order
+#   distance    float32[R, R]   distance[a, b] = shortest route from any door of room a to any door of room b (inf if unreachable)
+#   start       index[R, R]     door (vertex id) of room a the route starts at (NONE if unreachable)
+#   next_hop    index[R, R]     vertex after the start door on the route (NONE if unreachable / the start door is already in room b)
+# index is uint16 (NONE = 0xFFFF) for graphs with less than 0xFFFF vertices, otherwise int32 (NONE = -1)
+# The rest of a route is found by following the next hops (or a search to room b from there).
+
+MAGIC = b"IGRT"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHII")
+
+
+@dataclass
+class RoutingTable:
+    """Shortest routes between all rooms, see the layout above"""
+    room_ids: np.ndarray
+    distance: np.ndarray
+    start: np.ndarray
+    next_hop: np.ndarray
+    _room_indices: Dict[int, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # room id -> row / column, built once (room_ids can be a few thousand entries, scanned twice per lookup otherwise)
+        self._room_indices = {int(room_id): index for index, room_id in enumerate(self.room_ids)}
+
+    def lookup(self, from_room_id: int, to_room_id: int) -> Tuple[float, int, int]:
+        """(distance, start door, next hop) from one room to another"""
+        row = self._room_index(from_room_id)
+        column = self._room_index(to_room_id)
+        return float(self.distance[row, column]), int(self.start[row, column]), int(self.next_hop[row, column])
+
+    def _room_index(self, room_id: int) -> int:
+        index = self._room_indices.get(room_id)
+        if index is None:
+            raise KeyError(f"Room {room_id} is not in the routing table")
+        return index
+
+
+# graph of the worker process (sent once per worker with the initializer, instead of once per task)
+_worker_graph: Optional[RoutingGraph] = None
+
+
+def _init_table_worker(routing_graph: RoutingGraph) -> None:
+    global _worker_graph
+    _worker_graph = routing_graph
+
+
+def _table_row(doors: List[int], room_doors: List[List[int]], routing_graph: Optional[RoutingGraph] = None) -> Tuple[List[float], List[int], List[int]]:
+    """One row of the table: a single search from all doors of a room, then the closest door of every room"""
+    routing_graph = routing_graph or _worker_graph
+    distances, origins, first_hops = routing_graph.search_tree(doors)
+
+    row_distances, row_starts, row_hops = [], [], []
+    for target_doors in room_doors:
+        closest = min(target_doors, key=distances.__getitem__)
+        row_distances.append(distances[closest])
+        row_starts.append(origins[closest])
+        row_hops.append(first_hops[closest])
+    return row_distances, row_starts, row_hops
+
+
+def build_routing_table(routing_graph: RoutingGraph, workers: int = 1) -> RoutingTable:
+    """
+    Computes the table for all rooms referenced by the vertices (one multi source search per room).
+    With workers > 1 the rows are computed in parallel by a process pool.
+    """
+    doors_by_room: Dict[int, List[int]] = {}
+    for vertex, room_ids in enumerate(routing_graph.vertex_rooms):
+        for room_id in room_ids:
+            doors = doors_by_room.setdefault(room_id, [])
+            if vertex not in doors:
+                doors.append(vertex)
+
+    room_ids = sorted(doors_by_room)
+    room_doors = [doors_by_room[room_id] for room_id in room_ids]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_table_worker, initargs=(routing_graph,)) as executor:
+            rows = list(executor.map(_table_row, room_doors, [room_doors] * len(room_doors),
+                                     chunksize=max(1, len(room_doors) // (4 * workers))))
+    else:
+        rows = [_table_row(doors, room_doors, routing_graph) for doors in room_doors]
+
+    return RoutingTable(
+        np.array(room_ids, dtype=np.int32),
+        np.array([row[0] for row in rows], dtype=np.float32).reshape(len(room_ids), len(room_ids)),
+        np.array([row[1] for row in rows], dtype=np.int32).reshape(len(room_ids), len(room_ids)),
+        np.array([row[2] for row in rows], dtype=np.int32).reshape(len(room_ids), len(room_ids)),
+    )
+
+
+def _index_type(vertex_count: int) -> type:
+    return np.uint16 if vertex_count < np.iinfo(np.uint16).max else np.int32
+
+
+def write_routing_table(table: RoutingTable, fileobj: BinaryIO, vertex_count: int) -> None:
+    """Writes the table in the binary format described at the top of this file (-1 entries become NONE)"""
+    index_type = _index_type(vertex_count)
+    fileobj.write(_HEADER.pack(MAGIC, VERSION, len(table.room_ids), vertex_count))
+    for array in (table.room_ids, table.distance, table.start.astype(index_type), table.next_hop.astype(index_type)):
+        fileobj.write(np.ascontiguousarray(array).tobytes())
+
+
+def read_routing_table(fileobj: BinaryIO) -> RoutingTable:
+    """Reads a table written by write_routing_table"""
+    data = fileobj.read()
+    magic, version, room_count, vertex_count = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a routing table file (version {VERSION})")
+
+    position = _HEADER.size
+    arrays = []
+    index_type = _index_type(vertex_count)
+    for dtype, count in ((np.int32, room_count), (np.float32, room_count ** 2), (index_type, room_count ** 2), (index_type, room_count ** 2)):
+        arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=position))
+        position += arrays[-1].nbytes
+    room_ids, distance, start, next_hop = arrays
+
+    def to_vertex_ids(array: np.ndarray) -> np.ndarray:
+        vertex_ids = array.astype(np.int32).reshape(room_count, room_count)
+        if index_type == np.uint16:
+            vertex_ids[array.reshape(room_count, room_count) == np.iinfo(np.uint16).max] = -1
+        return vertex_ids
+
+    return RoutingTable(room_ids, distance.reshape(room_count, room_count), to_vertex_ids(start), to_vertex_ids(next_hop))
+
+
+# builds the table for an exported graph: python routingTable.py resources/{building}_graph.json [workers]
+if __name__ == "__main__":
+    with open(sys.argv[1], encoding="utf-8") as f:
+        routing_graph = RoutingGraph.from_json(json.load(f))
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    start_time = time.perf_counter()
+    table = build_routing_table(routing_graph, workers)
+    room_count = len(table.room_ids)
+    table_file = io.BytesIO()
+    write_routing_table(table, table_file, routing_graph.vertex_count)
+    print(f"{room_count} rooms, table built in {time.perf_counter() - start_time:.2f}s with {workers} worker(s), "
+          f"{len(table_file.getvalue()) / 1024:.0f} KiB, {np.isinf(table.distance).sum()} unreachable pairs")
+
+    # spot check against single queries
+    mismatches = 0
+    for row in range(0, room_count, max(1, room_count // 20)):
+        for column in range(0, room_count, max(1, room_count // 20)):
+            doors = [v for v, ids in enumerate(routing_graph.vertex_rooms) if table.room_ids[row] in ids]
+            targets = [v for v, ids in enumerate(routing_graph.vertex_rooms) if table.room_ids[column] in ids]
+            best = min((routing_graph._search([door], targets, "dijkstra") for door in doors),
+                       key=lambda route: route.path.weight if route else math.inf)
+            expected = best.path.weight if best else math.inf
+            mismatches += not math.isclose(float(table.distance[row, column]), expected, rel_tol=1e-6)
+    print("mismatches:", mismatches)
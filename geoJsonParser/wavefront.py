@@ -1,32 +1,222 @@
+import gzip
+import io
 import math
-from typing import Tuple, List
+from typing import Tuple, List, Dict, TextIO, Any
 from shapely.geometry.polygon import Polygon
 import matplotlib.pyplot as plt
 from matplotlib.patches import Polygon as MplPolygon
 import numpy as np
+import shapely
 from shapely.geometry import MultiPolygon
+from shapely.geometry.polygon import orient
+
+
+def _grow(buffer: np.ndarray, required: int) -> np.ndarray:
+    """Returns the buffer, or a copy with (at least) doubled capacity if it can't hold 'required' rows."""
+    if required <= len(buffer):
+        return buffer
+    grown = np.empty((max(required, 2 * len(buffer)),) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer
+    return grown
+
 
 class Wavefront:
     def __init__(self, merge_threshold=0.02, default_material=" "):
-        self.vertex_normal_pairs: List[Tuple[Tuple[float, float, float], Tuple[float, float, float]]] = []
-        self.faces: List[List[int]] = []
-        self.materials: List[str] = []
+        # vertices and normals as float32 arrays (grown on demand), only the first vertex_count rows are used
+        self._vertices: np.ndarray = np.empty((64, 3), dtype=np.float32)
+        self._normals: np.ndarray = np.empty((64, 3), dtype=np.float32)
+        self.vertex_count: int = 0
+
+        # all faces share one index buffer, face i uses _indices[_face_offsets[i]:_face_offsets[i + 1]]
+        self._indices: np.ndarray = np.empty(256, dtype=np.int32)
+        self._face_offsets: np.ndarray = np.zeros(65, dtype=np.int32)
+        self._face_materials: np.ndarray = np.empty(64, dtype=np.int16)  # id into material_names
+        self.face_count: int = 0
+
+        self.material_names: List[str] = []
+        self._material_ids: Dict[str, int] = {}
+
         self.merge_threshold: float = merge_threshold
         self.default_material: str = default_material
 
+        # spatial hash for vertex welding (cell size = merge_threshold), maps cell -> vertex indices in that cell
+        self._vertex_grid: Dict[Tuple[int, int, int], List[int]] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """The spatial hash isn't pickled, it is rebuilt from the vertices"""
+        state = self.__dict__.copy()
+        del state["_vertex_grid"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._rebuild_vertex_grid()
+
+    @property
+    def vertices(self) -> np.ndarray:
+        """(vertex_count, 3) float32 view of the vertex positions"""
+        return self._vertices[:self.vertex_count]
+
+    @property
+    def normals(self) -> np.ndarray:
+        """(vertex_count, 3) float32 view of the vertex normals"""
+        return self._normals[:self.vertex_count]
+
+    @property
+    def indices(self) -> np.ndarray:
+        """flat int32 view of the vertex indices of all faces"""
+        return self._indices[:self._face_offsets[self.face_count]]
+
+    @property
+    def face_offsets(self) -> np.ndarray:
+        """(face_count + 1) int32 view, face i uses indices[face_offsets[i]:face_offsets[i + 1]]"""
+        return self._face_offsets[:self.face_count + 1]
+
+    @property
+    def face_materials(self) -> np.ndarray:
+        """int16 view of the material id (index into material_names) of each face"""
+        return self._face_materials[:self.face_count]
+
+    def get_face(self, face_idx: int) -> np.ndarray:
+        """Returns the vertex indices of a face."""
+        return self._indices[self._face_offsets[face_idx]:self._face_offsets[face_idx + 1]]
+
+    def triangulate(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Triangulates all faces, convex ones (most of them) as a fan, the others by ear clipping.
+        Returns the (n, 3) int32 vertex indices of the triangles (in face order) and the material id of each triangle.
+        """
+        offsets = self.face_offsets
+        triangle_counts = np.maximum(np.diff(offsets) - 2, 0)
+        face_of_triangle = np.repeat(np.arange(self.face_count), triangle_counts)
+
+        # triangle k of a face uses its vertices 0, k + 1, k + 2
+        first = offsets[:-1][face_of_triangle]
+        k = np.arange(len(face_of_triangle)) - np.repeat(np.cumsum(triangle_counts) - triangle_counts, triangle_counts)
+
+        indices = self.indices
+        triangles = np.stack([indices[first], indices[first + k + 1], indices[first + k + 2]], axis=1)
+
+        concave = np.flatnonzero(self._concave_faces())
+        if len(concave):
+            fan = ~np.isin(face_of_triangle, concave)
+            clipped = [(face_idx, self._ear_clip(face_idx)) for face_idx in concave.tolist()]
+            triangles = np.concatenate([triangles[fan]] + [face_triangles for _, face_triangles in clipped])
+            face_of_triangle = np.concatenate([face_of_triangle[fan]] + [np.full(len(t), f) for f, t in clipped])
+            order = np.argsort(face_of_triangle, kind="stable")
+            triangles, face_of_triangle = triangles[order], face_of_triangle[order]
+
+        return triangles.astype(np.int32), self.face_materials[face_of_triangle]
+
+    def _concave_faces(self) -> np.ndarray:
+        """Boolean mask of the faces that have a vertex turning against the face normal (a fan would be wrong for them)."""
+        offsets = self.face_offsets
+        if self.face_count == 0:
+            return np.zeros(0, dtype=bool)
+
+        positions = np.arange(len(self.indices))
+        next_positions = positions + 1
+        next_positions[offsets[1:] - 1] = offsets[:-1]
+        previous_positions = positions - 1
+        previous_positions[offsets[:-1]] = offsets[1:] - 1
+
+        face_vertices = self.vertices[self.indices].astype(np.float64)
+        turns = np.cross(face_vertices - face_vertices[previous_positions], face_vertices[next_positions] - face_vertices)
+        face_ids = np.repeat(np.arange(self.face_count), np.diff(offsets))
+        alignment = np.einsum("ij,ij->i", turns, self.face_normals()[face_ids])
+        return np.minimum.reduceat(alignment, offsets[:-1]) < -1e-9
+
+    def _ear_clip(self, face_idx: int) -> np.ndarray:
+        """Triangulates one (simple, possibly concave) face by ear clipping, keeping its winding."""
+        face = self.get_face(face_idx)
+        points = self.vertices[face].astype(np.float64)
+
+        # project onto the plane the face is flattest in, oriented so the face is counter-clockwise
+        newell = np.cross(points, np.roll(points, -1, axis=0)).sum(axis=0)
+        axis = int(np.argmax(np.abs(newell)))
+        projected = np.delete(points, axis, axis=1)
+        if (newell[axis] < 0) != (axis == 1):
+            projected[:, 0] = -projected[:, 0]
+
+        def cross(a: int, b: int, c: int) -> float:
+            (ax, ay), (bx, by), (cx, cy) = projected[a], projected[b], projected[c]
+            return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+        remaining = list(range(len(face)))
+        triangles = []
+        while len(remaining) > 3:
+            for i in range(len(remaining)):
+                a, b, c = remaining[i - 1], remaining[i], remaining[(i + 1) % len(remaining)]
+                if cross(a, b, c) <= 0:
+                    continue
+                # an ear must not contain any other vertex of the face
+                if any(cross(a, b, p) >= 0 and cross(b, c, p) >= 0 and cross(c, a, p) >= 0
+                       for p in remaining if p not in (a, b, c)):
+                    continue
+                triangles.append((a, b, c))
+                remaining.pop(i)
+                break
+            else:
+                # no ear found (degenerated / self intersecting face), the rest is fanned
+                break
+        triangles.extend((remaining[0], remaining[i], remaining[i + 1]) for i in range(1, len(remaining) - 1))
+        return face[np.array(triangles, dtype=np.int64).reshape(-1, 3)]
+
+    def _get_material_id(self, material_name: str) -> int:
+        """Returns the id of a material, registering it if it is new."""
+        material_id = self._material_ids.get(material_name)
+        if material_id is None:
+            material_id = len(self.material_names)
+            self.material_names.append(material_name)
+            self._material_ids[material_name] = material_id
+        return material_id
+
     def _is_close(self, v1: Tuple[float, float, float], v2: Tuple[float, float, float]) -> bool:
         """Check if two vertices are close enough to be considered the same."""
         return math.dist(v1, v2) < self.merge_threshold
 
+    @staticmethod
+    def _same_normal(n1: Tuple[float, float, float], n2: Tuple[float, float, float]) -> bool:
+        """Check if two normals point in the same direction (so a vertex can be shared by faces with these normals)."""
+        return math.dist(n1, n2) < 1e-3
+
+    def _grid_cell(self, vertex: Tuple[float, float, float]) -> Tuple[int, int, int]:
+        """Returns the spatial hash cell of a vertex (cells are merge_threshold wide)."""
+        return (math.floor(vertex[0] / self.merge_threshold),
+                math.floor(vertex[1] / self.merge_threshold),
+                math.floor(vertex[2] / self.merge_threshold))
+
     def _find_or_add_vertex(self, vertex: Tuple[float, float, float], normal: Tuple[float, float, float]) -> int:
-        """ Find an existing vertex or add a new one if it doesn't exist."""
+        """
+        Find an existing vertex (same position and normal) or add a new one if it doesn't exist.
+        Vertices are only welded if their normals match, so faces meeting at an edge keep their own normals
+        (e.g. the top and the sides of a wall).
+        """
         if normal is None:
             raise ValueError("Cannot add a vertex without a normal")
-        for idx, (v, _) in enumerate(self.vertex_normal_pairs):
-            if self._is_close(v, vertex):
-                return idx
-        self.vertex_normal_pairs.append((vertex, normal))
-        return len(self.vertex_normal_pairs) - 1
+
+        # any vertex closer than merge_threshold has to be in one of the 27 cells around this one
+        # (taking the lowest index, so the result is the same as scanning all vertices in order)
+        cx, cy, cz = self._grid_cell(vertex)
+        closest_idx = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    for idx in self._vertex_grid.get((cx + dx, cy + dy, cz + dz), ()):
+                        if (closest_idx is None or idx < closest_idx) and self._is_close(self._vertices[idx], vertex) \
+                                and self._same_normal(self._normals[idx], normal):
+                            closest_idx = idx
+        if closest_idx is not None:
+            return closest_idx
+
+        idx = self.vertex_count
+        self._vertices = _grow(self._vertices, idx + 1)
+        self._normals = _grow(self._normals, idx + 1)
+        self._vertices[idx] = vertex
+        self._normals[idx] = normal
+        self.vertex_count += 1
+        self._vertex_grid.setdefault((cx, cy, cz), []).append(idx)
+        return idx
 
     def add_face(self, vertex_list: List[Tuple[float, float, float]],
                  normal_list: List[Tuple[float, float, float]],
@@ -36,185 +226,372 @@ class Wavefront:
             raise ValueError("The number of vertices and normals must match, and normals cannot be None")
 
         indices = [self._find_or_add_vertex(v, n) for v, n in zip(vertex_list, normal_list)]
-        self.faces.append(indices)
-        self.materials.append(material_name or self.default_material)
+        self.add_face_indices(indices, material_name)
 
     def add_face_indices(self, vertex_indices: List[int], material_name: str = None):
         """Adds a face to the Wavefront object using pre-existing vertex indices."""
-        self.faces.append(vertex_indices)
-        self.materials.append(material_name or self.default_material)
+        start = self._face_offsets[self.face_count]
+        end = start + len(vertex_indices)
+
+        self._indices = _grow(self._indices, end)
+        self._face_offsets = _grow(self._face_offsets, self.face_count + 2)
+        self._face_materials = _grow(self._face_materials, self.face_count + 1)
+
+        self._indices[start:end] = vertex_indices
+        self._face_offsets[self.face_count + 1] = end
+        self._face_materials[self.face_count] = self._get_material_id(material_name or self.default_material)
+        self.face_count += 1
+
+    def _keep_faces(self, keep: np.ndarray) -> None:
+        """Compacts the face buffers, keeping only the faces where the boolean mask 'keep' is set (order is preserved)."""
+        offsets = self.face_offsets
+        sizes = np.diff(offsets)
+        keep_indices = np.repeat(keep, sizes)
+
+        self._indices = self.indices[keep_indices].copy()
+        self._face_materials = self.face_materials[keep].copy()
+        self._face_offsets = np.zeros(np.count_nonzero(keep) + 1, dtype=np.int32)
+        np.cumsum(sizes[keep], out=self._face_offsets[1:])
+        self.face_count = len(self._face_offsets) - 1
 
 
     def remove_redundant_faces(self):
         """
             Removes overlapping faces that lie along the dimension axis (X, Y, Z).
-            Actually not really needed, but nice to have, in retrospect
+            (faces completely covered by another face at the same depth, as happens with the walls of neighbouring rooms)
         """
 
 
-        def fix_overlaps(faces: List[List[int]], axis_index: int, depth_tolerance=self.merge_threshold) -> List[List[int]]:
-            """ Removes unnecessary faces that overlap along the specified axis."""
-            # Sort faces by depth
-
-            len_before = len(faces)
+        def find_overlaps(faces: np.ndarray, axis_index: int, depth_tolerance=self.merge_threshold) -> np.ndarray:
+            """ Returns the faces (given by face index) that are covered by another face along the specified axis."""
+            if len(faces) == 0:
+                return faces
 
-            polygons = []
-            depths = []
+            offsets = self.face_offsets
+            sizes = offsets[faces + 1] - offsets[faces]
+            face_indices = np.concatenate([self.indices[offsets[f]:offsets[f + 1]] for f in faces.tolist()])
+            vertices = self.vertices[face_indices].astype(np.float64)
 
-            for face in faces:
-                vertices = [self.vertex_normal_pairs[i][0] for i in face]
+            # Calculate average of removed axis, sort faces by depth
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            depths = np.add.reduceat(vertices[:, axis_index], starts) / sizes
+            order = np.argsort(depths, kind="stable")
 
-                # Project to 2D by removing axis_index
-                projected = [tuple(coord for j, coord in enumerate(v) if j != axis_index) for v in vertices]
+            # Project to 2D by removing axis_index
+            projected = np.delete(vertices, axis_index, axis=1)
+            polygons = shapely.polygons(shapely.linearrings(projected, indices=np.repeat(np.arange(len(faces)), sizes)))
 
-                # Calculate average of removed axis
-                avg_depth = sum(v[axis_index] for v in vertices) / len(vertices)
+            # split into slabs of faces, where each depth is within the tolerance of the previous one
+            sorted_depths = depths[order]
+            slab_breaks = np.flatnonzero(np.diff(sorted_depths) > depth_tolerance) + 1
 
-                polygons.append(Polygon(projected))
-                depths.append(avg_depth)
+            to_delete = set()
+            for slab in np.split(order, slab_breaks):
+                if len(slab) < 2:
+                    continue
 
-            # sort by depth
-            sorted_pairs = sorted(zip(depths, polygons), key=lambda x: x[0])
+                # only bounding box candidates are tested with contains (done by the tree in one go)
+                tree = shapely.STRtree(polygons[slab])
+                buffered = shapely.buffer(polygons[slab], depth_tolerance, join_style="mitre")
+                containing, contained = tree.query(buffered, predicate="contains")
 
-            if sorted_pairs:
-                depths, polygons = zip(*sorted_pairs)
-                depths = list(depths)
-                polygons = list(polygons)
-            else:
-                depths = []
-                polygons = []
+                close = (containing != contained) & (np.abs(depths[slab[containing]] - depths[slab[contained]]) <= depth_tolerance)
+                containing, contained = slab[containing[close]], slab[contained[close]]
 
-            buffered_polygons = [p.buffer(depth_tolerance, join_style="mitre") for p in polygons]
+                # going through the faces by depth, faces that were removed can't remove others anymore
+                covered_by: Dict[int, List[int]] = {}
+                for i, j in zip(containing.tolist(), contained.tolist()):
+                    covered_by.setdefault(i, []).append(j)
 
-            to_delete = set()
-
-            for i in range(len(polygons)):
-                if i in to_delete:
-                    continue
+                for i in slab.tolist():
+                    if i in to_delete or i not in covered_by:
+                        continue
+                    to_delete.update(covered_by[i])
 
+            print(f"removed {len(to_delete)} unnecessary faces")
+            return faces[sorted(to_delete)]
 
-                #remove all contained before face1
-                j = i-1
-                while j > 0:
-                    face2 = polygons[j]
 
-                    orthogonal_distance = abs(depths[i] - depths[j])
-                    if orthogonal_distance > depth_tolerance:
-                        break
+        print("Removing unnecessary faces...")
 
-                    if j in to_delete:
-                        j -= 1
-                        continue
+        #removing all where 2 or more indices are the same
+        face_ids = np.repeat(np.arange(self.face_count), np.diff(self.face_offsets))
+        order = np.lexsort((self.indices, face_ids))
+        duplicate = (face_ids[order][1:] == face_ids[order][:-1]) & (self.indices[order][1:] == self.indices[order][:-1])
+        keep = np.ones(self.face_count, dtype=bool)
+        keep[face_ids[order][1:][duplicate]] = False
+        self._keep_faces(keep)
 
-                    if buffered_polygons[i].contains(face2):
-                        to_delete.add(j)
+        orientations = self.get_orientations()
 
-                    j -= 1
+        keep = np.ones(self.face_count, dtype=bool)
+        for axis_index in range(3):
+            keep[find_overlaps(np.flatnonzero(orientations == axis_index), axis_index)] = False
 
+        self._keep_faces(keep)
 
-                #remove all contained behind face1
-                j = i+1
-                while j < len(faces):
-                    face2 = polygons[j]
 
-                    orthogonal_distance = abs(depths[i] - depths[j])
-                    if orthogonal_distance > depth_tolerance:
-                        break
+    def face_normals(self) -> np.ndarray:
+        """
+        Returns the geometric normal of each face (from the vertex order, counter-clockwise around the normal).
+        Degenerated faces get a zero normal.
+        """
+        offsets = self.face_offsets
+        sizes = np.diff(offsets)
+        if self.face_count == 0:
+            return np.zeros((0, 3), dtype=np.float64)
+
+        # Newell's method: sum of the cross products of consecutive vertices (wrapping around per face)
+        positions = np.arange(len(self.indices))
+        next_positions = positions + 1
+        next_positions[offsets[1:] - 1] = offsets[:-1]
+
+        face_vertices = self.vertices[self.indices].astype(np.float64)
+        normals = np.add.reduceat(np.cross(face_vertices, face_vertices[next_positions]), offsets[:-1], axis=0)
+        normals[sizes == 0] = 0
+
+        lengths = np.linalg.norm(normals, axis=1)
+        valid = lengths > 1e-9
+        normals[valid] /= lengths[valid, None]
+        normals[~valid] = 0
+        return normals
+
+    def merge_coplanar_faces(self) -> Tuple[int, int, int, int]:
+        """
+        Merges adjacent (or overlapping) faces lying in the same plane, with the same material and facing,
+        into larger convex polygons (so a fan triangulation of each stays minimal).
+        Faces that can't be merged are kept as they are. Vertices of the mesh lying on the outline of a merged face
+        stay in it (even if collinear), so faces sharing them don't get T-junctions / cracks.
+        Returns (faces before, faces after, vertices before, vertices after).
+        """
+        faces_before, vertices_before = self.face_count, self.vertex_count
+        if self.face_count == 0:
+            return faces_before, faces_before, vertices_before, vertices_before
+
+        normals = self.face_normals()
+        offsets = self.face_offsets
+        first_vertices = self.vertices[self.indices[offsets[:-1]]].astype(np.float64)
+        plane_offsets = np.einsum("ij,ij->i", normals, first_vertices)
+        all_vertices = self.vertices.astype(np.float64)
+
+        # faces are in the same plane if normal and offset match (within the merge threshold)
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        keys = np.column_stack((
+            self.face_materials,
+            np.round(normals * 1000),
+            np.round(plane_offsets / self.merge_threshold),
+        )).astype(np.int64)
+        valid = np.any(normals != 0, axis=1)
+        for face_idx in np.flatnonzero(valid).tolist():
+            groups.setdefault(tuple(keys[face_idx].tolist()), []).append(face_idx)
+
+        keep = np.ones(self.face_count, dtype=bool)
+        merged_faces: List[Tuple[List[Tuple[float, float, float]], Tuple[float, float, float], str]] = []
+
+        for group in groups.values():
+            if len(group) < 2:
+                continue
+
+            normal = normals[group].mean(axis=0)
+            normal /= np.linalg.norm(normal)
+            plane_offset = plane_offsets[group].mean()
+
+            # 2D basis in the plane, with u x v = normal (so counter-clockwise in 2D stays counter-clockwise around the normal)
+            helper = np.array((1.0, 0.0, 0.0)) if abs(normal[0]) < 0.9 else np.array((0.0, 1.0, 0.0))
+            u = np.cross(helper, normal)
+            u /= np.linalg.norm(u)
+            v = np.cross(normal, u)
 
-                    if j in to_delete:
-                        j += 1
-                        continue
+            polygons = []
+            for face_idx in group:
+                face_vertices = self.vertices[self.get_face(face_idx)].astype(np.float64)
+                polygons.append(Polygon(np.column_stack((face_vertices @ u, face_vertices @ v))))
 
-                    if buffered_polygons[i].contains(face2):
-                        to_delete.add(j)
+            merged = [(polygon, sources) for polygon, sources in self._merge_convex(polygons) if len(sources) > 1]
+            if not merged:
+                continue
 
-                    j += 1
+            # all mesh vertices in this plane, the ones on the outline of a merged face are kept in it
+            in_plane = np.abs(all_vertices @ normal - plane_offset) < self.merge_threshold
+            plane_points = np.column_stack((all_vertices[in_plane] @ u, all_vertices[in_plane] @ v))
 
+            # the shading normal is the stored normal of the faces (which may point against the winding)
+            stored_normal = self.normals[self.get_face(group[0])].astype(np.float64).mean(axis=0)
+            shading_normal = tuple((normal if np.dot(stored_normal, normal) >= 0 else -normal).tolist())
+            material = self.material_names[self.face_materials[group[0]]]
 
-            # Remove completely contained faces
-            faces = [face for i, face in enumerate(faces) if i not in to_delete]
+            for polygon, sources in merged:
+                coords = self._insert_outline_points(np.array(orient(polygon, 1.0).exterior.coords[:-1]), plane_points)
+                points = plane_offset * normal + coords[:, :1] * u + coords[:, 1:] * v
+                merged_faces.append(([tuple(p) for p in points.tolist()], shading_normal, material))
+                keep[[group[source] for source in sources]] = False
 
-            print(f"removed {len_before - len(faces)} unnecessary faces")
-            return faces
+        self._keep_faces(keep)
+        for face, shading_normal, material in merged_faces:
+            self.add_face(face, [shading_normal] * len(face), material)
+        self._remove_unused_vertices()
 
+        return faces_before, self.face_count, vertices_before, self.vertex_count
 
-        print("Removing unnecessary faces...")
+    def _merge_convex(self, polygons: List[Polygon]) -> List[Tuple[Polygon, List[int]]]:
+        """
+        Greedily merges touching / overlapping 2D polygons, as long as the union stays convex.
+        Repeats until nothing can be merged anymore, returns the resulting polygons with the indices of the polygons
+        they were made of (invalid / empty polygons are left out, they are never merged).
+        """
+        merging = [(polygon, [i]) for i, polygon in enumerate(polygons) if polygon.is_valid and not polygon.is_empty]
+        tolerance = self.merge_threshold ** 2
 
-        self.faces = [face for face in self.faces if len(set(face)) == len(face)]   #removing all where 2 or more indices are the same
+        merged_something = True
+        while merged_something and len(merging) > 1:
+            merged_something = False
 
-        oriented_x : List[List[int]] = []
-        oriented_y : List[List[int]] = []
-        oriented_z : List[List[int]] = []
-        non_aligned = []
+            # only polygons whose bounding boxes overlap can be merged
+            tree = shapely.STRtree([polygon for polygon, _ in merging])
+            first, second = tree.query([polygon for polygon, _ in merging], predicate="intersects")
 
-        # For each face, store the original face indices along with the transformed data
-        for face_idx, face in enumerate(self.faces):
-            orientation = self.get_orientation(face)
+            used = set()
+            merged = []
+            for i, j in zip(first.tolist(), second.tolist()):
+                if i >= j or i in used or j in used:
+                    continue
 
-            match orientation:
-                case "x":
-                    oriented_x.append(face)
-                case "y":
-                    oriented_y.append(face)
-                case "z":
-                    oriented_z.append(face)
-                case _:
-                    non_aligned.append(face)
+                union = merging[i][0].union(merging[j][0]).simplify(0)
+                if union.geom_type != "Polygon" or union.interiors:
+                    continue
 
-        self.faces = non_aligned
+                hull = union.convex_hull
+                if hull.area - union.area < tolerance:
+                    merged.append((hull, merging[i][1] + merging[j][1]))
+                    used.update((i, j))
+                    merged_something = True
 
-        oriented_x = fix_overlaps(oriented_x, 0)
-        oriented_y = fix_overlaps(oriented_y, 1)
-        oriented_z = fix_overlaps(oriented_z, 2)
+            merging = [entry for k, entry in enumerate(merging) if k not in used] + merged
 
-        for face in oriented_x:
-            self.add_face_indices(face)
+        return merging
 
-        for face in oriented_y:
-            self.add_face_indices(face)
+    def _insert_outline_points(self, outline: np.ndarray, points: np.ndarray) -> np.ndarray:
+        """
+        Inserts the given 2D points that lie on an edge of the outline (within merge_threshold) into it,
+        in order along the edge. Points at the corners of the outline are skipped.
+        """
+        result = []
+        for start, end in zip(outline, np.roll(outline, -1, axis=0)):
+            result.append(start)
+            direction = end - start
+            length = np.linalg.norm(direction)
+            if length < self.merge_threshold:
+                continue
+
+            along = (points - start) @ direction / length
+            across = np.abs((points - start) @ np.array((-direction[1], direction[0]))) / length
+            on_edge = (across < self.merge_threshold) & (along > self.merge_threshold) & (along < length - self.merge_threshold)
+            for index in np.argsort(along[on_edge], kind="stable").tolist():
+                point = points[on_edge][index]
+                if math.dist(point, result[-1]) >= self.merge_threshold:
+                    result.append(point)
+        return np.array(result)
+
+    def _remove_unused_vertices(self) -> None:
+        """Drops vertices no face refers to anymore, and remaps the face indices."""
+        used = np.zeros(self.vertex_count, dtype=bool)
+        used[self.indices] = True
+        if used.all():
+            return
+
+        new_index = np.cumsum(used, dtype=np.int32) - 1
+        self._indices = new_index[self.indices]
+        self._vertices = self.vertices[used].copy()
+        self._normals = self.normals[used].copy()
+        self.vertex_count = len(self._vertices)
+
+        self._rebuild_vertex_grid()
+
+    def _rebuild_vertex_grid(self) -> None:
+        """Recreates the spatial hash from the stored vertices."""
+        self._vertex_grid = {}
+        for idx, vertex in enumerate(self.vertices.tolist()):
+            self._vertex_grid.setdefault(self._grid_cell(vertex), []).append(idx)
+
+    def get_orientations(self) -> np.ndarray:
+        """
+        Returns the orientation axis (0 = x, 1 = y, 2 = z) each face is flattest in,
+        or -1 if all extents are above threshold.
+        """
+        if self.face_count == 0:
+            return np.empty(0, dtype=np.int8)
 
-        for face in oriented_z:
-            self.add_face_indices(face)
+        face_vertices = self.vertices[self.indices]
+        starts = self.face_offsets[:-1]
+        extents = np.maximum.reduceat(face_vertices, starts, axis=0) - np.minimum.reduceat(face_vertices, starts, axis=0)
 
+        orientations = np.argmin(extents, axis=1).astype(np.int8)
+        orientations[extents.min(axis=1) >= self.merge_threshold] = -1
+        return orientations
 
     def get_orientation(self, face1):
         """Returns the orientation axis ('x', 'y', 'z') the face is flattest in, or 'none' if all extents are above threshold."""
 
-        x_values = [self.vertex_normal_pairs[vertex][0][0] for vertex in face1]
-        y_values = [self.vertex_normal_pairs[vertex][0][1] for vertex in face1]
-        z_values = [self.vertex_normal_pairs[vertex][0][2] for vertex in face1]
-
-        extents = {
-            "x": max(x_values) - min(x_values),
-            "y": max(y_values) - min(y_values),
-            "z": max(z_values) - min(z_values)
-        }
+        face_vertices = self.vertices[face1]
+        extents = face_vertices.max(axis=0) - face_vertices.min(axis=0)
 
-        smallest_axis = min(extents, key=extents.get)
+        smallest_axis = int(np.argmin(extents))
         smallest_extent = extents[smallest_axis]
 
         if smallest_extent < self.merge_threshold:
-            return smallest_axis
+            return "xyz"[smallest_axis]
         else:
             return "none"
 
+    def write(self, fileobj: TextIO, mtl_file: str = "materials.mtl", chunk_size: int = 65536) -> None:
+        """
+        Streams the mesh as OBJ text into a file object (open in text mode, plain or gzip).
+        Records are formatted and written in chunks of chunk_size, so the whole file never has to be held in memory.
+        """
+        fileobj.write(f"mtllib {mtl_file}\n")
+
+        for prefix, values, precision in (("v", self.vertices, 6), ("vn", self.normals, 4)):
+            line_template = f"{prefix} %.{precision}f %.{precision}f %.{precision}f\n"
+            for start in range(0, len(values), chunk_size):
+                chunk = values[start:start + chunk_size]
+                fileobj.write((line_template * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+        # each face references vertex and normal with the same index ("f v//vn"), one template per face size
+        face_templates: Dict[int, str] = {}
+        offsets = self.face_offsets
+        sizes = np.diff(offsets).tolist()
+        materials = self.face_materials
+
+        # write runs of faces with the same material
+        run_starts = np.flatnonzero(np.diff(materials, prepend=-1)).tolist() + [self.face_count]
+        for run_start, run_end in zip(run_starts[:-1], run_starts[1:]):
+            fileobj.write(f"usemtl {self.material_names[materials[run_start]]}\n")
+
+            for start in range(run_start, run_end, chunk_size):
+                end = min(start + chunk_size, run_end)
+                chunk_sizes = sizes[start:end]
+                for size in chunk_sizes:
+                    if size not in face_templates:
+                        face_templates[size] = "f" + " %d//%d" * size + "\n"
+
+                # OBJ indices start at 1
+                chunk_indices = np.repeat(self._indices[offsets[start]:offsets[end]] + 1, 2)
+                template = "".join(face_templates[size] for size in chunk_sizes)
+                fileobj.write(template % tuple(chunk_indices.tolist()))
+
+    def save(self, filename: str, mtl_file: str = "materials.mtl", compress: bool = False) -> None:
+        """Writes the mesh to an OBJ file, gzip compressed if compress is set."""
+        if compress:
+            with gzip.open(filename, "wt") as f:
+                self.write(f, mtl_file)
+        else:
+            with open(filename, "w") as f:
+                self.write(f, mtl_file)
+
     def __str__(self, mtl_file="materials.mtl") -> str:
-        lines = [f"mtllib {mtl_file}"]
-
-        for vertex, _ in self.vertex_normal_pairs:
-            lines.append(f"v {vertex[0]} {vertex[1]} {vertex[2]}")
-            # You could add normals here if needed:
-            # lines.append(f"vn {normal[0]} {normal[1]} {normal[2]}")
-
-        last_material = None
-        for face, material in zip(self.faces, self.materials):
-            if material != last_material:
-                lines.append(f"usemtl {material}")
-                last_material = material
-            face_line = "f " + " ".join(f"{idx + 1}//{idx + 1}" for idx in face)
-            lines.append(face_line)
-
-        return "\n".join(lines)
+        buffer = io.StringIO()
+        self.write(buffer, mtl_file)
+        return buffer.getvalue()
 
 
 